@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+import ssl
+import time
+from collections import deque
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from ai.metrics import metrics
+from ai.ollama_client import GenerationResult, OllamaError, TIMING_FIELDS, record_generation
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class AsyncOllamaClient:
+    """asyncio counterpart of ``OllamaClient`` for the headless API.
+
+    Speaks HTTP/1.1 directly over asyncio streams with a small keep-alive
+    pool, so thousands of concurrent streams cost coroutines rather than
+    threads. A request that finds its pooled socket closed by Ollama is
+    sent once more on a fresh connection. Async generators can't return a value, so ``generate`` yields
+    ``str`` deltas followed by one final ``GenerationResult``.
+    """
+
+    def __init__(
+        self,
+        host: str = "http://localhost:11434",
+        connect_timeout: float = 3.05,
+        read_timeout: float = 30.0,
+        first_token_timeout: float = 120.0,
+        max_retries: int = 2,
+        backoff_factor: float = 0.3,
+        pool_size: int = 32,
+        keep_alive: str = os.environ.get("OLLAMA_KEEP_ALIVE", "30m"),
+    ):
+        self.host = host.rstrip("/")
+        self.keep_alive = keep_alive
+        parts = urlsplit(self.host)
+        self._tls = parts.scheme == "https"
+        self._hostname = parts.hostname or "localhost"
+        self._port = parts.port or (443 if self._tls else 80)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.first_token_timeout = first_token_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self._idle: Deque[Connection] = deque()
+
+    # ---------- CONNECTIONS ----------
+    async def _connect(self) -> Connection:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await asyncio.wait_for(
+                    asyncio.open_connection(
+                        self._hostname, self._port, ssl=ssl.create_default_context() if self._tls else None
+                    ),
+                    self.connect_timeout,
+                )
+            except (OSError, asyncio.TimeoutError):
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+
+    def _pooled(self) -> Optional[Connection]:
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def _checkin(self, conn: Connection, headers: Dict[str, str]):
+        reusable = headers.get("connection", "").lower() != "close" and not conn[1].is_closing()
+        if reusable and len(self._idle) < self.pool_size:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def aclose(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    # ---------- HTTP ----------
+    async def _request(self, method: str, path: str, body: Optional[Dict], timeout: float):
+        """Send a request; returns (status, headers, connection)"""
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        head = (
+            f"{method} {path} HTTP/1.1\r\nHost: {self._hostname}:{self._port}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode("ascii")
+        conn = self._pooled()
+        if conn is not None:
+            try:
+                return await self._exchange(conn, head + data, timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass    # Ollama closed the idle socket; once more on a fresh one
+        return await self._exchange(await self._connect(), head + data, timeout)
+
+    async def _exchange(self, conn: Connection, request: bytes, timeout: float):
+        reader, writer = conn
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), timeout)
+            if not status_line:
+                raise ConnectionError("connection closed by Ollama")
+            status = int(status_line.split()[1])
+            headers = {}
+            while (line := await asyncio.wait_for(reader.readline(), timeout)) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            return status, headers, conn
+        except BaseException:
+            writer.close()
+            raise
+
+    async def _body_chunks(self, headers: Dict[str, str], reader: asyncio.StreamReader, first_timeout: float):
+        """Yield raw body bytes, handling chunked and Content-Length bodies"""
+        timeout = first_timeout
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await asyncio.wait_for(reader.readline(), timeout)
+                size = int(size_line.split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await reader.readline()
+                    return
+                chunk = await asyncio.wait_for(reader.readexactly(size + 2), timeout)
+                timeout = self.read_timeout
+                yield chunk[:-2]
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            if length:
+                yield await asyncio.wait_for(reader.readexactly(length), timeout)
+        elif headers.get("connection", "").lower() == "close":
+            while chunk := await asyncio.wait_for(reader.read(65536), timeout):
+                timeout = self.read_timeout
+                yield chunk     # body runs to EOF
+
+    async def _json(self, method: str, path: str, body: Optional[Dict] = None, timeout: float = 5.0) -> Dict:
+        status, headers, conn = await self._request(method, path, body, timeout)
+        try:
+            raw = b"".join([c async for c in self._body_chunks(headers, conn[0], timeout)])
+        except BaseException:
+            conn[1].close()
+            raise
+        self._checkin(conn, headers)
+        data = json.loads(raw or b"{}")
+        if status >= 400:
+            raise OllamaError(data.get("error") or f"HTTP {status}", status)
+        return data
+
+    # ---------- API ----------
+    async def get_models(self) -> List[str]:
+        data = await self._json("GET", "/api/tags")
+        return [m["name"] for m in data.get("models", [])]
+
+    async def is_running(self) -> bool:
+        try:
+            await self._json("GET", "/api/tags")
+            return True
+        except (OSError, ValueError, OllamaError, asyncio.TimeoutError):
+            return False
+
+    async def generate(
+        self,
+        messages: List[Dict],
+        model: str = "llama3.2",
+        options: Optional[Dict] = None,
+    ) -> AsyncGenerator[Union[str, GenerationResult], None]:
+        """Stream deltas, then the ``GenerationResult``. Closing the generator
+        (or cancelling its task) closes the connection so Ollama aborts."""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": {"temperature": 0.1, "top_p": 0.9, "num_predict": 2048, **(options or {})}
+        }
+        started = time.perf_counter()
+        status, headers, conn = await self._request("POST", "/api/chat", payload, self.first_token_timeout)
+        reader, writer = conn
+        finished = False
+        try:
+            if status >= 400:
+                raw = b"".join([c async for c in self._body_chunks(headers, reader, self.read_timeout)])
+                raise OllamaError(json.loads(raw or b"{}").get("error") or f"HTTP {status}", status)
+
+            parts: List[str] = []
+            final: Dict = {}
+            buffer = b""
+            async for chunk in self._body_chunks(headers, reader, self.first_token_timeout):
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if error := data.get("error"):
+                        raise OllamaError(error)
+                    if content := data.get("message", {}).get("content"):
+                        if not parts:
+                            metrics.observe("ollama_ttft_seconds", time.perf_counter() - started, model=model)
+                        parts.append(content)
+                        yield content
+                    if data.get("done"):
+                        final = data
+            finished = True
+            result = GenerationResult(
+                "".join(parts), model, final.get("done_reason"),
+                **{field: int(final.get(field) or 0) for field in TIMING_FIELDS},
+            )
+            record_generation(result, time.perf_counter() - started)
+            yield result
+        finally:
+            if finished:
+                self._checkin(conn, headers)
+            else:
+                writer.close()
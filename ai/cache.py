@@ -0,0 +1,211 @@
+import hashlib
+import re
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Generator, List, NamedTuple, Optional
+
+import numpy as np
+
+from ai.ollama_client import GenerationResult, OllamaClient
+
+NORMALISE_RE = re.compile(r"[^\w₹ ]+")
+SPACES_RE = re.compile(r"\s+")
+WORD_RE = re.compile(r"\w+")
+REPLAY_CHUNK_RE = re.compile(r"\S+\s*|\s+")
+
+
+def normalise(prompt: str) -> str:
+    text = NORMALISE_RE.sub(" ", prompt.lower())
+    return SPACES_RE.sub(" ", text).strip()
+
+
+def is_standalone(prompt: str, history_turns: int) -> bool:
+    """True if the answer to ``prompt`` can be shared with other users.
+
+    Only an opening question qualifies: a later reply was generated from
+    this user's own conversation (names, account details, earlier answers),
+    whatever the wording of the question.
+    """
+    return history_turns == 0
+
+
+def context_digest(messages: List[Dict]) -> str:
+    """Hash of everything sent to the model except the final user message:
+    system prompt, summary, history and retrieved excerpts"""
+    digest = hashlib.sha256()
+    for message in messages[:-1]:
+        digest.update(f"\x1e{message['role']}\x1f{message['content']}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+STOPWORDS = frozenset("""
+a an the my me i is am are was be what whats how can could do does did you your please pls
+to of for in on at and or tell show know want kindly will would should there
+""".split())
+
+
+def _features(text: str) -> List[tuple]:
+    words = [w.rstrip("s") if len(w) > 3 else w for w in WORD_RE.findall(normalise(text)) if w not in STOPWORDS]
+    features = [(w, 1.0) for w in words]
+    features += [(f"{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features += [(padded[i:i + 3], 0.25) for i in range(len(padded) - 2)]
+    return features
+
+
+def hashed_embedding(texts: List[str], dim: int = 1024) -> np.ndarray:
+    """Local stand-in embedder: hashed content-word unigrams/bigrams plus
+    lightly weighted character trigrams, L2-normalised. Catches rephrasings
+    and typos, not synonyms."""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature, weight in _features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vectors[row, h % dim] += weight if h & 0x80000000 else -weight
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+def ollama_embedder(client: OllamaClient, model: str = "nomic-embed-text") -> Callable[[List[str]], np.ndarray]:
+    """Embedder backed by Ollama's embeddings endpoint"""
+    def embed(texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(client.embed(texts, model), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+    embed.embedder_id = f"ollama:{model}"
+    return embed
+
+
+class CacheEntry(NamedTuple):
+    content: str
+    group: int              # model + prompt context
+    row: int                # row in the vector index
+    expires_at: float
+
+
+class CacheHit(NamedTuple):
+    content: str
+    tier: str               # "exact" or "semantic"
+    similarity: float
+
+
+class ResponseCache:
+    """Two-tier cache of complete assistant answers.
+
+    The exact tier is keyed on the normalised prompt plus model and the
+    context the answer was generated with (``context_digest``: system
+    prompt, retrieved excerpts), so an answer is only reused for the same
+    context. The semantic tier compares within one model and context; it
+    keeps one embedding per entry in a preallocated NumPy matrix and
+    answers a lookup with a single matrix-vector product, accepting the
+    best row at or above ``similarity``. Both tiers share LRU order, TTL and the size bound.
+    """
+
+    def __init__(
+        self,
+        embedder: Callable[[List[str]], np.ndarray] = hashed_embedding,
+        max_entries: int = 2048,
+        ttl: float = 6 * 3600,
+        similarity: float = 0.9,
+    ):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.stats = Counter()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._vectors: Optional[np.ndarray] = None
+        self._groups = np.full(max_entries, -1, dtype=np.int64)
+        self._row_keys: List[Optional[str]] = [None] * max_entries
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def _key(self, prompt: str, model: str, context: str) -> str:
+        raw = "\x1f".join((normalise(prompt), model, context))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _group(model: str, context: str) -> int:
+        """Semantic-tier partition: 60 bits of the model/context hash, so it
+        fits the int64 ``_groups`` row and needs no id table to grow"""
+        group_key = hashlib.sha256(f"{model}\x1f{context}".encode("utf-8")).hexdigest()
+        return int(group_key[:15], 16)
+
+    def lookup(self, prompt: str, model: str, context: str) -> Optional[CacheHit]:
+        key = self._key(prompt, model, context)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return CacheHit(entry.content, "exact", 1.0)
+            if entry:
+                self._evict(key, "expired")
+            if self._vectors is None or not self._entries:
+                self.stats["misses"] += 1
+                return None
+            group = self._group(model, context)
+
+        vector = self.embedder([prompt])[0]
+        with self._lock:
+            scores = self._vectors @ vector
+            scores[self._groups != group] = -1.0
+            row = int(np.argmax(scores))
+            best = float(scores[row])
+            key = self._row_keys[row]
+            entry = self._entries.get(key) if key else None
+            if entry is None or best < self.similarity:
+                self.stats["misses"] += 1
+                return None
+            if entry.expires_at <= now:
+                self._evict(key, "expired")
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["semantic_hits"] += 1
+            return CacheHit(entry.content, "semantic", best)
+
+    def store(self, prompt: str, model: str, context: str, content: str):
+        key = self._key(prompt, model, context)
+        vector = self.embedder([prompt])[0]
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            if key in self._entries:
+                self._evict(key, None)
+            while not self._free_rows:
+                self._evict(next(iter(self._entries)), "evictions")
+            row = self._free_rows.pop()
+            self._vectors[row] = vector
+            self._groups[row] = self._group(model, context)
+            self._row_keys[row] = key
+            self._entries[key] = CacheEntry(content, int(self._groups[row]), row, time.time() + self.ttl)
+            self.stats["stores"] += 1
+
+    def _evict(self, key: str, reason: Optional[str]):
+        entry = self._entries.pop(key)
+        self._vectors[entry.row] = 0.0
+        self._groups[entry.row] = -1
+        self._row_keys[entry.row] = None
+        self._free_rows.append(entry.row)
+        if reason:
+            self.stats[reason] += 1
+
+    def hit_rate(self) -> float:
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    @staticmethod
+    def replay(content: str, model: str = "") -> Generator[str, None, GenerationResult]:
+        """Stream a cached answer with the same protocol as ``OllamaClient.generate``"""
+        for chunk in REPLAY_CHUNK_RE.findall(content):
+            yield chunk
+        return GenerationResult(content, model, "cache")
+
+
+# Global response cache
+response_cache = ResponseCache()
@@ -0,0 +1,129 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from ai.metrics import metrics
+from ai.ollama_client import OllamaClient
+from ai.pool import backend_pool
+from ai.prompts import SUMMARY_PROMPT
+from storage.messages import Message
+
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for Llama tokenizers)"""
+    return (len(text) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def message_tokens(message: Message) -> int:
+    """Token estimate for a chat message, cached on the message itself"""
+    if message.tokens is None:
+        message.tokens = estimate_tokens(message.content)
+    return message.tokens
+
+
+class RollingSummary:
+    """Per-conversation context state: where the window starts and what came before it"""
+
+    def __init__(self):
+        self.start = 0      # first message still sent verbatim
+        self.covered = 0    # messages already folded into ``text``
+        self.text = ""
+        self.tokens = 0
+        self.prefix_hash = ""   # digest of the prompt head sent last turn
+        self.lock = threading.Lock()
+
+
+class ContextManager:
+    """Keep the prompt under a token budget.
+
+    When a conversation outgrows ``budget_tokens`` the window start jumps
+    forward far enough to land under ``low_water`` of the budget, so it only
+    moves every few turns and the prompt prefix stays cacheable in between.
+    Evicted turns are folded into a rolling summary by a background worker;
+    the current turn never waits for it.
+    """
+
+    def __init__(
+        self,
+        client: OllamaClient,
+        budget_tokens: int = 3072,
+        low_water: float = 0.6,
+        keep_recent: int = 4,
+        summary_words: int = 120,
+        workers: int = 2,
+    ):
+        self.client = client
+        self.budget_tokens = budget_tokens
+        self.low_water = low_water
+        self.keep_recent = keep_recent
+        self.summary_words = summary_words
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ctx-summary")
+
+    def build(self, system_prompt: str, messages: List[Message], summary: RollingSummary, model: str) -> List[Dict]:
+        """Return the messages to send to the model for the next turn"""
+        fixed = estimate_tokens(system_prompt) + summary.tokens
+        window = sum(message_tokens(m) for m in messages[summary.start:])
+
+        if fixed + window > self.budget_tokens:
+            target = self.budget_tokens * self.low_water
+            start = summary.start
+            last_start = max(summary.start, len(messages) - self.keep_recent)
+            while start < last_start and fixed + window > target:
+                window -= message_tokens(messages[start])
+                start += 1
+            # Never open the window on an assistant reply
+            while start < last_start and messages[start].role != "user":
+                window -= message_tokens(messages[start])
+                start += 1
+            if start > summary.start:
+                summary.start = start
+                self._executor.submit(self._summarise, summary, messages[:start], model)
+
+        context = [{"role": "system", "content": system_prompt}]
+        if summary.text:
+            context.append({"role": "system", "content": f"Earlier in this conversation: {summary.text}"})
+        context.extend(m.for_model() for m in messages[summary.start:])
+        self._track_prefix(summary, context)
+        return context
+
+    @staticmethod
+    def _track_prefix(summary: RollingSummary, context: List[Dict]):
+        """Count turns whose prompt head (system prompt, summary and first
+        window message) is byte-identical to the previous turn's, i.e. turns
+        where Ollama can reuse its cached prefix"""
+        head = hashlib.blake2b(digest_size=8)
+        for message in context[:3 if summary.text else 2]:
+            head.update(message["role"].encode("utf-8") + b"\0" + message["content"].encode("utf-8") + b"\0")
+        digest = head.hexdigest()
+        if summary.prefix_hash:
+            metrics.inc("prompt_prefix_turns_total", reused="yes" if digest == summary.prefix_hash else "no")
+        summary.prefix_hash = digest
+
+    def _summarise(self, summary: RollingSummary, history: List[Message], model: str):
+        with summary.lock:
+            if summary.covered >= len(history):
+                return
+            transcript = "\n".join(f"{m.role}: {m.content}" for m in history[summary.covered:])
+            if summary.text:
+                transcript = f"Previous summary: {summary.text}\n{transcript}"
+            prompt = [
+                {"role": "system", "content": SUMMARY_PROMPT.format(max_words=self.summary_words)},
+                {"role": "user", "content": transcript},
+            ]
+            stream = self.client.generate(prompt, model, options={"num_predict": self.summary_words * 2})
+            try:
+                while True:
+                    next(stream)
+            except StopIteration as stop:
+                text = stop.value.content.strip()
+            except Exception:
+                return  # keep the old summary; the next eviction retries
+            summary.text = text
+            summary.tokens = estimate_tokens(text)
+            summary.covered = len(history)
+
+
+# Global context manager
+context_manager = ContextManager(backend_pool)
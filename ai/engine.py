@@ -0,0 +1,372 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, AsyncGenerator, Dict, Generator, List, NamedTuple, Optional, Tuple, Union
+
+from ai.cache import CacheHit, context_digest, is_standalone, response_cache
+from ai.cancel import CancelToken
+from ai.context import RollingSummary, context_manager
+from ai.guard import is_banking_question
+from ai.metrics import metrics
+from ai.ollama_client import GenerationResult
+from ai.pool import backend_pool
+from ai.prompts import SYSTEM_PROMPT
+from ai.retrieval import knowledge_base
+from ai.router import router
+from ai.scheduler import Overloaded, WaitCallback
+from ai.singleflight import flight_key, single_flight
+from storage.conversations import store
+from storage.messages import Message
+
+REFUSAL = (
+    "I am your SmartBank virtual officer and can help **only** with "
+    "banking-related questions like balances, transfers, cards, loans, "
+    "EMIs, and security issues."
+)
+STOPPED_NOTE = "\n\n⏹ *Stopped*"
+
+
+class Conversation:
+    """State of one open chat.
+
+    ``st.session_state`` exposes the same attributes, so the Streamlit UI
+    hands its session straight to the engine; the API keeps one of these
+    per conversation instead.
+    """
+
+    def __init__(self, owner_id: str, conversation_id: Optional[int] = None, messages: Optional[List[Message]] = None):
+        self.owner_id = owner_id
+        self.conversation_id = conversation_id
+        self.messages: List[Message] = messages if messages is not None else []
+        self.context_summary = RollingSummary()
+
+
+class Speculation:
+    """A generation started before the turn's checks have passed.
+
+    Its deltas are held in the flight until ``release``; a check that
+    answers or refuses the turn ``abandon``s it, which leaves the flight
+    and cancels upstream when nobody else is listening. Whichever reads
+    the stream first owns it, so a front end can always ``abandon`` on the
+    way out: it is a no-op once the released stream is being read.
+    """
+
+    def __init__(self):
+        self.cancel = CancelToken()
+        self.stream: Optional[Generator[str, None, GenerationResult]] = None
+        self.first_token_at: Optional[float] = None
+        self._on_wait: Optional[WaitCallback] = None
+        self._last_wait: Optional[Tuple[int, float]] = None
+        self._claimed = False
+        self._claim_lock = threading.Lock()
+
+    def watch(self, stream: Generator[str, None, GenerationResult]) -> Generator[str, None, GenerationResult]:
+        """Pass ``stream`` through, noting when its first token arrived"""
+        try:
+            try:
+                delta = next(stream)
+            except StopIteration as stop:
+                return stop.value
+            self.first_token_at = time.perf_counter()
+            yield delta
+            return (yield from stream)
+        finally:
+            stream.close()
+
+    def on_wait(self, position: int, eta: float):
+        self._last_wait = (position, eta)
+        if self._on_wait:
+            self._on_wait(position, eta)
+
+    def release(
+        self, on_wait: Optional[WaitCallback] = None, cancel: Optional[CancelToken] = None
+    ) -> Generator[str, None, GenerationResult]:
+        """The held stream, with queue updates and cancellation now going to the caller"""
+        self._on_wait = on_wait
+        if on_wait and self._last_wait:
+            on_wait(*self._last_wait)
+        if cancel:
+            cancel.on_cancel(lambda: self.cancel.cancel(cancel.reason or "cancelled"))
+        return self._consume()
+
+    def abandon(self, reason: str):
+        if not self._claim():
+            return      # its consumer has the stream and sees any cancel itself
+        self.cancel.cancel(reason)
+        # A cancelled subscriber leaves its flight on the first step, without yielding
+        for _ in self.stream:
+            pass
+
+    def _consume(self) -> Generator[str, None, GenerationResult]:
+        if not self._claim():
+            return GenerationResult("", "", "cancelled")
+        return (yield from self.stream)
+
+    def _claim(self) -> bool:
+        with self._claim_lock:
+            claimed, self._claimed = self._claimed, True
+        return not claimed
+
+
+class Turn(NamedTuple):
+    """What ``begin_turn`` decided for one user message"""
+    path: str                           # "router" | "refused" | "cache" | "llm"
+    prompt: str
+    model: str
+    reply: Optional[str] = None         # final answer when no generation is needed
+    messages: Optional[List[Dict]] = None
+    cacheable: bool = False
+    cached: Optional[CacheHit] = None
+    speculation: Optional[Speculation] = None
+
+
+class ChatEngine:
+    """The chat pipeline without any UI.
+
+    One turn is ``begin_turn`` (persist, route, guard, build the prompt,
+    look up the cache), then ``stream``/``astream`` for the reply, then
+    ``finish_turn`` or ``fail_turn`` to persist the outcome. Front ends
+    only render.
+
+    With ``speculative`` (``SMARTBANK_SPECULATIVE=1``) ``begin_turn`` builds
+    the prompt first and starts generating while the router, guard and
+    cache run, so their latency overlaps the model's time to first token
+    instead of adding to it. The cost is a wasted (and promptly cancelled)
+    generation for every turn those checks answer or refuse.
+    """
+
+    def __init__(self, pool=backend_pool, context=context_manager, kb=knowledge_base,
+                 cache=response_cache, conversations=store, intents=router, flights=single_flight,
+                 system_prompt=SYSTEM_PROMPT, guard=is_banking_question,
+                 speculative: bool = os.environ.get("SMARTBANK_SPECULATIVE") == "1"):
+        self.pool = pool
+        self.system_prompt = system_prompt
+        self.guard = guard
+        self.speculative = speculative
+        self.flights = flights
+        self.context = context
+        self.kb = kb
+        self.cache = cache
+        self.store = conversations
+        self.router = intents
+
+    # ---------- STATE ----------
+    def add_message(self, state: Any, role: str, content: str) -> Message:
+        """Append a message to the open chat and persist it"""
+        message = Message(role, content)
+        state.messages.append(message)
+        if state.conversation_id is None:
+            state.conversation_id = self.store.create_conversation(state.owner_id, content)
+        self.store.append(state.conversation_id, role, content, message.ts, owner=state.owner_id)
+        return message
+
+    def open_conversation(self, owner_id: str, conversation_id: int) -> Optional[Conversation]:
+        """Load the latest page of one of ``owner_id``'s conversations"""
+        if self.store.owner_of(conversation_id) != owner_id:
+            return None
+        page = self.store.load_messages(conversation_id)
+        return Conversation(owner_id, conversation_id, page.messages)
+
+    # ---------- TURN ----------
+    def begin_turn(self, state: Any, prompt: str, model: str) -> Turn:
+        """Record the user message and decide how it gets answered"""
+        self.add_message(state, "user", prompt)
+        if getattr(state, "context_summary", None) is None:
+            state.context_summary = RollingSummary()
+        if self.speculative:
+            return self._begin_speculative(state, prompt, model)
+
+        started = time.perf_counter()
+        answered = self._screen(state, prompt, model)
+        if answered:
+            return answered
+        screened = time.perf_counter()
+        messages = self._build(state, prompt, model)
+        built = time.perf_counter()
+        cacheable, cached = self._lookup(state, prompt, model, messages)
+        checks = (screened - started) + (time.perf_counter() - built)
+        _critical_path("sequential", prompt_build=built - screened, checks=checks)
+        return Turn("cache" if cached else "llm", prompt, model, None, messages, cacheable, cached)
+
+    def _begin_speculative(self, state: Any, prompt: str, model: str) -> Turn:
+        """``begin_turn`` with generation running alongside the checks"""
+        started = time.perf_counter()
+        messages = self._build(state, prompt, model)
+        built = time.perf_counter()
+        speculation = Speculation()
+        speculation.stream = self.flights.generate(
+            flight_key(prompt, model, messages), model,
+            lambda upstream, waiting: speculation.watch(self.pool.generate(
+                messages, model, session_id=state.owner_id, on_wait=waiting, cancel=upstream
+            )),
+            speculation.on_wait, speculation.cancel,
+        )
+
+        try:
+            answered = self._screen(state, prompt, model)
+            cacheable, cached = (False, None) if answered else self._lookup(state, prompt, model, messages)
+        except BaseException:
+            speculation.abandon("error")
+            raise
+        if answered or cached:
+            outcome = answered.path if answered else "cache"
+            speculation.abandon(outcome)
+            metrics.inc("speculative_turns_total", outcome=outcome)
+            return answered or Turn("cache", prompt, model, None, messages, cacheable, cached)
+
+        # The checks only lengthen the critical path by as long as they held
+        # back a token that was already there (a joined flight counts as none)
+        checked = time.perf_counter()
+        first = speculation.first_token_at
+        held = max(0.0, checked - first) if first is not None else 0.0
+        metrics.inc("speculative_turns_total", outcome="released")
+        metrics.observe("speculation_overlap_seconds", checked - built - held)
+        _critical_path("speculative", prompt_build=built - started, checks=held)
+        return Turn("llm", prompt, model, None, messages, cacheable, None, speculation)
+
+    def _screen(self, state: Any, prompt: str, model: str) -> Optional[Turn]:
+        """Router and guard; the finished turn when one of them answers"""
+        # Common intents are answered without the model
+        with metrics.span("route"):
+            routed = self.router.route(prompt)
+        if routed:
+            self.add_message(state, "assistant", routed.response)
+            return Turn("router", prompt, model, reply=routed.response)
+
+        with metrics.span("guard"):
+            allowed = self.guard(prompt)
+        if not allowed:
+            self.add_message(state, "assistant", REFUSAL)
+            return Turn("refused", prompt, model, reply=REFUSAL)
+        return None
+
+    def _build(self, state: Any, prompt: str, model: str) -> List[Dict]:
+        with metrics.span("prompt_build"):
+            messages = self.context.build(self.system_prompt, state.messages, state.context_summary, model)
+            return self.kb.augment(messages, prompt)
+
+    def _lookup(self, state: Any, prompt: str, model: str, messages: List[Dict]) -> Tuple[bool, Optional[CacheHit]]:
+        with metrics.span("cache_lookup"):
+            # Answers are shared across users, so only for opening questions
+            # and only with the exact context they were generated from
+            cacheable = is_standalone(prompt, len(state.messages) - 1)
+            cached = self.cache.lookup(prompt, model, context_digest(messages)) if cacheable else None
+        return cacheable, cached
+
+    def stream(
+        self,
+        turn: Turn,
+        session_id: str = "",
+        on_wait: Optional[WaitCallback] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Generator[str, None, GenerationResult]:
+        """Reply stream for a turn, in the ``OllamaClient.generate`` protocol.
+        Identical turns in flight at the same time share one generation."""
+        if turn.cached:
+            return self.cache.replay(turn.cached.content, turn.model)
+        if turn.speculation:
+            return turn.speculation.release(on_wait, cancel)
+        return self.flights.generate(
+            flight_key(turn.prompt, turn.model, turn.messages), turn.model,
+            lambda upstream, waiting: self.pool.generate(
+                turn.messages, turn.model, session_id=session_id, on_wait=waiting, cancel=upstream
+            ),
+            on_wait, cancel,
+        )
+
+    async def astream(
+        self,
+        turn: Turn,
+        session_id: str = "",
+        on_wait: Optional[WaitCallback] = None,
+    ) -> AsyncGenerator[Union[str, GenerationResult], None]:
+        """Reply stream for a turn in the ``AsyncOllamaClient.generate`` protocol"""
+        if turn.cached:
+            yield turn.cached.content
+            yield GenerationResult(turn.cached.content, turn.model, "cache")
+            return
+        if turn.speculation:
+            # Already generating on the thread flight; relay it to the loop
+            async for item in _relay(turn.speculation.release(on_wait), turn.speculation.cancel):
+                yield item
+            return
+        stream = self.flights.agenerate(
+            flight_key(turn.prompt, turn.model, turn.messages), turn.model,
+            lambda waiting: self.pool.agenerate(
+                turn.messages, turn.model, session_id=session_id, on_wait=waiting
+            ),
+            on_wait,
+        )
+        async for item in stream:
+            yield item
+
+    def finish_turn(self, state: Any, turn: Turn, result: GenerationResult) -> str:
+        """Persist the reply (and cache it when it is shareable); returns what was saved"""
+        if result.done_reason == "cancelled":
+            return self.interrupt_turn(state, result.content)
+        if turn.cacheable and not turn.cached and result.done_reason == "stop":
+            self.cache.store(turn.prompt, turn.model, context_digest(turn.messages), result.content)
+        self.add_message(state, "assistant", result.content)
+        return result.content
+
+    def interrupt_turn(self, state: Any, partial: str) -> str:
+        """Persist whatever was generated before the turn was stopped"""
+        content = partial + STOPPED_NOTE
+        self.add_message(state, "assistant", content)
+        return content
+
+    def fail_turn(self, state: Any, error: Exception) -> str:
+        """Persist the message shown for a failed turn"""
+        content = f"🚦 {error}" if isinstance(error, Overloaded) else f"❌ AI Error: {str(error)}"
+        self.add_message(state, "assistant", content)
+        return content
+
+
+def _critical_path(mode: str, **stages: float):
+    for stage, seconds in stages.items():
+        metrics.observe("critical_path_seconds", seconds, stage=stage, mode=mode)
+
+
+async def _relay(
+    stream: Generator[str, None, GenerationResult], cancel: CancelToken
+) -> AsyncGenerator[Union[str, GenerationResult], None]:
+    """A thread-side stream in the ``AsyncOllamaClient.generate`` protocol.
+    Leaving early cancels it."""
+    loop = asyncio.get_running_loop()
+    items: "asyncio.Queue[Union[str, GenerationResult, BaseException]]" = asyncio.Queue()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(items.put_nowait, item)
+        except RuntimeError:    # the loop has closed
+            cancel.cancel("closed")
+
+    def pump():
+        try:
+            while True:
+                put(next(stream))
+        except StopIteration as stop:
+            put(stop.value)
+        except BaseException as e:
+            put(e)
+        finally:
+            stream.close()
+
+    threading.Thread(target=pump, name="speculation-relay", daemon=True).start()
+    finished = False
+    try:
+        while not finished:
+            item = await items.get()
+            if isinstance(item, BaseException):
+                finished = True
+                raise item
+            finished = isinstance(item, GenerationResult)
+            yield item
+    finally:
+        if not finished:
+            cancel.cancel("interrupted")
+
+
+# Global engine shared by the Streamlit UI and the HTTP API
+engine = ChatEngine()
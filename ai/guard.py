@@ -0,0 +1,135 @@
+import re
+from typing import Dict, Iterable, Set, Tuple
+
+# canonical keyword -> classifier weight. Weak terms (< 1.0) are common in
+# everyday speech and only count as banking next to a strong term.
+BANK_TERMS: Dict[str, float] = {
+    "account": 1.0, "balance": 1.0, "loan": 1.0, "emi": 1.0, "interest": 1.0,
+    "card": 1.0, "credit": 1.0, "debit": 1.0, "statement": 1.0, "transaction": 1.0,
+    "transfer": 1.0, "upi": 1.0, "imps": 1.0, "neft": 1.0, "rtgs": 1.0, "fd": 1.0,
+    "rd": 1.0, "fixed deposit": 1.0, "recurring deposit": 1.0, "net banking": 1.0,
+    "cheque": 1.0, "branch": 1.0, "ifsc": 1.0, "limit": 1.0, "otp": 1.0, "pin": 1.0,
+    "security": 1.0, "atm": 1.0, "kyc": 1.0, "bank": 1.0, "banking": 1.0, "deposit": 1.0,
+    "withdraw": 1.0, "withdrawal": 1.0, "passbook": 1.0, "nominee": 1.0, "cibil": 1.0,
+    "mortgage": 1.0, "overdraft": 1.0, "credit card": 1.0, "debit card": 1.0, "refund": 1.0, "payment": 1.0,
+    "money": 0.5, "savings": 1.0, "salary": 0.5, "mpin": 1.0, "cvv": 1.0, "beneficiary": 1.0,
+}
+
+# keyword -> context that gives away its everyday meaning; a keyword found
+# together with its context doesn't count ("speed limit", "birthday card")
+NEGATIVE_CONTEXT: Dict[str, str] = {
+    "limit": r"(?:speed|time|word|character|age|upload|size) limits?|calculus",
+    "pin": r"pin (?:this|it|that)|pinned|message|chat|post|tweet|comment|pinterest",
+    "card": r"(?:birthday|greeting|wedding|invitation|thank[\s-]?you|sim|memory|sd|graphics|video|sound|report|"
+            r"playing|business|visiting) cards?",
+    "credit": r"extra credits?|student|project|course|assignment|movie|film|(?:end|opening) credits",
+    "transfer": r"photos?|pictures?|files?|data|contacts|chats|whatsapp|bluetooth|android|iphone|laptop|"
+                r"college|university|school|player|window|heat|learning",
+    "refund": r"flight|airline|amazon|flipkart|myntra|swiggy|zomato|order|ticket|irctc|booking",
+    "payment": r"swiggy|zomato|amazon|flipkart|myntra|uber|ola",
+    "security": r"clearance|patch|wi-?fi|router|home|phone|laptop|software|guard|camera|social security",
+    "interest": r"interest(?:ed|ing)|interests|hobbies",
+    "statement": r"(?:problem|mission|vision|press|thesis|opening|closing|personal|sql|if|switch|print) statements?",
+    "branch": r"git|repo|merge|tree|river|olive|executive|judiciary",
+}
+
+# Common spellings, typos and Hinglish words -> canonical keyword
+VARIANTS: Dict[str, str] = {
+    "a/c": "account", "acc": "account", "acct": "account", "accnt": "account",
+    "acount": "account", "accout": "account", "khata": "account", "khaata": "account",
+    "balence": "balance", "ballance": "balance", "blance": "balance", "baki": "balance",
+    "lone": "loan", "karz": "loan", "karza": "loan", "rin": "loan",
+    "intrest": "interest", "byaj": "interest", "biyaj": "interest",
+    "netbanking": "net banking", "internet banking": "net banking", "online banking": "net banking",
+    "chq": "cheque", "chek": "cheque", "tranfer": "transfer", "transefer": "transfer",
+    "bhejna": "transfer", "bhejo": "transfer", "paisa": "money", "paise": "money",
+    "paisa bhejna": "transfer", "jama": "deposit", "nikalna": "withdraw",
+    "fixdeposit": "fixed deposit",
+    "bachat": "savings",
+}
+
+BANK_KEYWORDS = list(BANK_TERMS)
+
+STRONG = 1.0
+WEAK_CAP = 0.5   # highest score a text with only weak terms can reach
+
+SUFFIXES = r"(?:s|es|ed|ing|red|ring)?"
+
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """Regex alternation factored as a trie so matching cost grows with
+    input length rather than with the number of keywords"""
+    trie: Dict = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        optional = "" in node
+        branches = []
+        for ch in sorted(k for k in node if k):
+            piece = r"[\s\-]*" if ch == " " else re.escape(ch)
+            branches.append(piece + build(node[ch]))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if optional:
+            body = "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+def _compile(terms: Dict[str, float], variants: Dict[str, str]) -> Tuple[re.Pattern, Dict[str, str]]:
+    canonical = {term: term for term in terms}
+    canonical.update(variants)
+    pattern = re.compile(
+        r"(?<![\w/])(" + _trie_pattern(canonical) + ")" + SUFFIXES + r"(?![\w/])",
+        re.IGNORECASE,
+    )
+    return pattern, canonical
+
+
+# Built once at import time
+_PATTERN, _CANONICAL = _compile(BANK_TERMS, VARIANTS)
+_CONTEXT = {term: re.compile(r"\b(?:" + context + r")\b", re.IGNORECASE) for term, context in NEGATIVE_CONTEXT.items()}
+_SPACES = re.compile(r"[\s\-]+")
+
+
+def _terms_in(text: str, pattern: re.Pattern, canonical: Dict[str, str]) -> Set[str]:
+    found = set()
+    for m in pattern.finditer(text):
+        term = canonical.get(_SPACES.sub(" ", m.group(1).lower()))
+        if term and not (term in _CONTEXT and _CONTEXT[term].search(text)):
+            found.add(term)
+    return found
+
+
+def matched_terms(text: str) -> Set[str]:
+    """Canonical banking keywords present in ``text``, minus those whose
+    negative context is present too"""
+    return _terms_in(text, _PATTERN, _CANONICAL)
+
+
+def banking_score(text: str) -> float:
+    """Lightweight classifier score: sum of distinct keyword weights, held
+    at ``WEAK_CAP`` unless a strong term is present"""
+    weights = [BANK_TERMS[t] for t in matched_terms(text)]
+    if not any(w >= STRONG for w in weights):
+        return min(sum(weights), WEAK_CAP)
+    return sum(weights)
+
+
+def is_banking_question(text: str, scored: bool = False, threshold: float = 1.0) -> bool:
+    """True if ``text`` is about banking.
+
+    By default any whole-word strong keyword counts, unless its negative
+    context says otherwise ("speed limit", "pin this message"); the weak
+    "money" and "salary" never do on their own. With ``scored=True`` the
+    weighted classifier decides against ``threshold``.
+    """
+    if scored:
+        return banking_score(text) >= threshold
+    return any(BANK_TERMS[t] >= STRONG for t in matched_terms(text))
@@ -0,0 +1,212 @@
+"""Per-turn latency and throughput instrumentation.
+
+Everything is recorded into one process-wide registry and exposed in
+Prometheus text format, either over HTTP (``SMARTBANK_METRICS_PORT``) or
+written periodically to a file (``SMARTBANK_METRICS_FILE``).
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Iterator, List, Tuple
+
+# Seconds; wide enough for both microsecond guard checks and minute-long generations
+DEFAULT_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0,
+)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120, 200)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative buckets for export plus a window of recent samples for percentiles"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    @contextmanager
+    def span(self, name: str, **labels: str) -> Iterator[None]:
+        """Record the duration of the block as ``<name>_seconds``"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - started, **labels)
+
+    def timed(self, name: str):
+        """Decorator form of ``span``"""
+        def wrap(fn):
+            @functools.wraps(fn)
+            def inner(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return inner
+        return wrap
+
+    def summary(self) -> List[Dict]:
+        """p50/p95/p99 of every histogram series, for the admin panel"""
+        rows = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                for key, hist in series.items():
+                    rows.append({
+                        "metric": name + (str(dict(key)) if key else ""),
+                        "count": hist.count,
+                        "p50": hist.percentile(0.50),
+                        "p95": hist.percentile(0.95),
+                        "p99": hist.percentile(0.99),
+                    })
+        return rows
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP smartbank_{name} {self._help[name]}")
+                lines.append(f"# TYPE smartbank_{name} counter")
+                for key, value in series.items():
+                    lines.append(f"smartbank_{name}{_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP smartbank_{name} {self._help[name]}")
+                lines.append(f"# TYPE smartbank_{name} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"smartbank_{name}_bucket{_labels(key, le=f'{bound:g}')} {cumulative}")
+                    lines.append(f"smartbank_{name}_bucket{_labels(key, le='+Inf')} {hist.count}")
+                    lines.append(f"smartbank_{name}_sum{_labels(key)} {hist.total:.6f}")
+                    lines.append(f"smartbank_{name}_count{_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: LabelKey, **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+# ---------- EXPORTERS ----------
+def start_http_exporter(registry: "MetricsRegistry", port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve ``/metrics`` from a daemon thread"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_file_exporter(registry: "MetricsRegistry", path: str, interval: float = 15.0) -> threading.Thread:
+    """Rewrite ``path`` with the current metrics every ``interval`` seconds"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(registry.render_prometheus())
+            os.replace(tmp, path)
+
+    thread = threading.Thread(target=loop, name="metrics-file", daemon=True)
+    thread.start()
+    return thread
+
+
+# Global registry
+metrics = MetricsRegistry()
+metrics.describe("turn_seconds", "Wall time of a chat turn from input to saved reply")
+metrics.describe("script_run_seconds", "Streamlit script run, labelled with the turn it ran (if any)")
+metrics.describe("guard_seconds", "Banking guard check")
+metrics.describe("prompt_build_seconds", "Context window and retrieval")
+metrics.describe("cache_lookup_seconds", "Response cache lookup")
+metrics.describe("critical_path_seconds", "Time a turn stage added before the reply could stream, by pipeline mode")
+metrics.describe("speculation_overlap_seconds", "Check time hidden behind a speculative generation")
+metrics.describe("speculative_turns_total", "Speculative generations, by whether they were released or abandoned")
+metrics.describe("queue_wait_seconds", "Time spent waiting for a backend slot")
+metrics.describe("ttft_seconds", "Time to first token as seen by the UI")
+metrics.describe("render_seconds", "Time spent pushing frames to the browser")
+metrics.describe("decode_tokens_per_second", "Ollama eval_count / eval_duration")
+metrics.describe("ollama_prompt_eval_seconds", "Ollama prompt_eval_duration")
+metrics.describe("ollama_load_seconds", "Ollama load_duration")
+metrics.describe("ollama_preload_seconds", "Background model preload")
+metrics.describe("ollama_stream_stalls_total", "Streams aborted for going quiet past the read timeout")
+metrics.describe("coalesced_requests_total", "Requests served by joining an identical in-flight generation")
+metrics.describe("prompt_prefix_turns_total", "Turns whose prompt head matched the previous turn's")
+
+_exporter_lock = threading.Lock()
+_exporters_started = False
+
+
+def start_exporters_from_env():
+    """Start the exporters configured in the environment (once per process)"""
+    global _exporters_started
+    with _exporter_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+    if port := os.environ.get("SMARTBANK_METRICS_PORT"):
+        start_http_exporter(metrics, int(port))
+    if path := os.environ.get("SMARTBANK_METRICS_FILE"):
+        start_file_exporter(metrics, path)
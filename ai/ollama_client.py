@@ -1,49 +1,485 @@
-import streamlit as st
 import requests
 import json
-from typing import List, Dict, Generator
+import os
+import socket
+import threading
+import time
+from typing import List, Dict, Generator, NamedTuple, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from ai.cancel import CancelToken
+from ai.metrics import RATE_BUCKETS, metrics
+
+
+class OllamaError(RuntimeError):
+    """Raised when the Ollama server reports an error in the stream"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status       # HTTP status, when the error came with one
+
+
+class ServerHealth(NamedTuple):
+    """Snapshot of one /api/tags probe; ``running`` is None until the first probe lands"""
+    running: Optional[bool]
+    models: Tuple[str, ...]
+    checked_at: float
+    loaded: Tuple[str, ...] = ()   # models currently resident in memory (/api/ps)
+
+
+class GenerationResult(NamedTuple):
+    """Return value of ``OllamaClient.generate`` once the stream is exhausted"""
+    content: str
+    model: str
+    done_reason: Optional[str]
+    # Server-side timings from the final stream message (nanoseconds)
+    prompt_eval_count: int = 0
+    prompt_eval_duration: int = 0
+    eval_count: int = 0
+    eval_duration: int = 0
+    load_duration: int = 0
+    total_duration: int = 0
+
+
+TIMING_FIELDS = (
+    "prompt_eval_count", "prompt_eval_duration", "eval_count",
+    "eval_duration", "load_duration", "total_duration",
+)
+
+
+def model_key(name: str) -> str:
+    """Canonical model name: Ollama treats ``llama3.2`` as ``llama3.2:latest``"""
+    return name if ":" in name else f"{name}:latest"
+
 
 class OllamaClient:
-    def __init__(self, host: str = "http://localhost:11434"):
-        self.host = host
-    
+    def __init__(
+        self,
+        host: str = "http://localhost:11434",
+        connect_timeout: float = 3.05,
+        read_timeout: float = 30.0,
+        first_token_timeout: float = 120.0,
+        max_retries: int = 2,
+        backoff_factor: float = 0.3,
+        pool_size: int = 32,
+        health_ttl: float = 30.0,
+        down_ttl: float = 5.0,
+        keep_alive: str = os.environ.get("OLLAMA_KEEP_ALIVE", "30m"),
+    ):
+        self.host = host.rstrip("/")
+        # Sent with every request so the model stays resident between turns
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.first_token_timeout = first_token_timeout
+        self.session = self._build_session(max_retries, backoff_factor, pool_size)
+        # Process-wide health cache shared by every Streamlit session
+        self.health_ttl = health_ttl
+        self.down_ttl = down_ttl
+        self._health = ServerHealth(None, (), float("-inf"))
+        self._health_lock = threading.Lock()
+        self._probe_done: Optional[threading.Event] = None
+        self._warming: Dict[str, threading.Event] = {}
+
+    @staticmethod
+    def _build_session(max_retries: int, backoff_factor: float, pool_size: int) -> requests.Session:
+        """Keep-alive session; retries only connect errors so a POST is never replayed"""
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            redirect=0,
+            status=0,
+            other=0,
+            backoff_factor=backoff_factor,
+            raise_on_status=False,
+        )
+        adapter = _AbortableAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self):
+        """Release all pooled connections"""
+        self.session.close()
+
+    def health(self, wait: float = 1.0) -> ServerHealth:
+        """Return cached server health, refreshing it in the background when stale.
+
+        Only the very first call waits (at most ``wait`` seconds) for a probe;
+        afterwards callers always get the last snapshot immediately while a
+        single background probe revalidates it.
+        """
+        health = self._health
+        ttl = self.health_ttl if health.running else self.down_ttl
+        if time.monotonic() - health.checked_at >= ttl:
+            probe_done = self._start_probe()
+            if health.running is None:
+                probe_done.wait(wait)
+                health = self._health
+        return health
+
+    def refresh_health(self, wait: float = 5.0) -> ServerHealth:
+        """Force a probe now and wait for its result"""
+        self._start_probe().wait(wait)
+        return self._health
+
+    def _start_probe(self) -> threading.Event:
+        with self._health_lock:
+            if self._probe_done is None:
+                self._probe_done = threading.Event()
+                threading.Thread(
+                    target=self._probe, args=(self._probe_done,),
+                    name="ollama-health", daemon=True,
+                ).start()
+            return self._probe_done
+
+    def _probe(self, done: threading.Event):
+        health = ServerHealth(False, (), time.monotonic())
+        try:
+            response = self.session.get(f"{self.host}/api/tags", timeout=(self.connect_timeout, 5))
+            response.raise_for_status()
+            models = tuple(m["name"] for m in response.json().get("models", []))
+            health = ServerHealth(True, models, time.monotonic(), self._loaded_models())
+        except Exception:
+            # Unreachable, or not answering like Ollama (e.g. a malformed payload)
+            health = ServerHealth(False, (), time.monotonic())
+        finally:
+            # Always clear the in-flight probe, or no probe would ever run again
+            with self._health_lock:
+                self._health = health
+                self._probe_done = None
+            done.set()
+
+    def _loaded_models(self) -> Tuple[str, ...]:
+        try:
+            response = self.session.get(f"{self.host}/api/ps", timeout=(self.connect_timeout, 5))
+            return tuple(m["name"] for m in response.json().get("models", []))
+        except Exception:
+            return ()
+
+    # ---------- MODEL LIFECYCLE ----------
+    def load_state(self, model: str) -> str:
+        """``"loaded"``, ``"loading"`` (a preload is in flight) or ``"cold"``"""
+        key = model_key(model)
+        if key in self._warming:
+            return "loading"
+        if key in {model_key(m) for m in self._health.loaded}:
+            return "loaded"
+        return "cold"
+
+    def preload(self, model: str) -> threading.Event:
+        """Load ``model`` into memory in the background unless it already is.
+
+        An empty /api/chat request makes Ollama load the model and return,
+        so the first real turn doesn't pay the load. Returns an event set
+        once the model is resident (or the attempt failed).
+        """
+        key = model_key(model)
+        with self._health_lock:
+            if key in self._warming:
+                return self._warming[key]
+            done = threading.Event()
+            if key in {model_key(m) for m in self._health.loaded}:
+                done.set()
+                return done
+            self._warming[key] = done
+        threading.Thread(target=self._preload, args=(model, key, done), name="ollama-preload", daemon=True).start()
+        return done
+
+    def _preload(self, model: str, key: str, done: threading.Event):
+        started = time.perf_counter()
+        try:
+            response = self.session.post(
+                f"{self.host}/api/chat",
+                json={"model": model, "messages": [], "keep_alive": self.keep_alive},
+                timeout=(self.connect_timeout, self.first_token_timeout),
+            )
+            response.raise_for_status()
+            metrics.observe("ollama_preload_seconds", time.perf_counter() - started, model=model)
+        except requests.RequestException:
+            pass  # the first turn will load it instead
+        finally:
+            self._start_probe().wait(5)
+            with self._health_lock:
+                self._warming.pop(key, None)
+            done.set()
+
     def get_models(self) -> List[str]:
         """Get available Ollama models"""
-        try:
-            response = requests.get(f"{self.host}/api/tags", timeout=5)
-            return [m["name"] for m in response.json().get("models", [])]
-        except:
-            return []
-    
+        return list(self.health().models)
+
     def is_running(self) -> bool:
         """Check if Ollama server is running"""
-        try:
-            requests.get(f"{self.host}/api/tags", timeout=5)
-            return True
-        except:
-            return False
-    
-    def generate(self, messages: List[Dict], model: str = "llama3.2") -> Generator[str, None, None]:
-        """Stream response from Ollama"""
+        return bool(self.health().running)
+
+    def generate(
+        self,
+        messages: List[Dict],
+        model: str = "llama3.2",
+        options: Optional[Dict] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Generator[str, None, GenerationResult]:
+        """Stream response from Ollama.
+
+        Yields text deltas only; the complete reply is the generator's return
+        value (``StopIteration.value``) as a ``GenerationResult``. The HTTP
+        stream is closed as soon as the generator is closed, so a consumer
+        that stops early (``break``, ``close()``, garbage collection) drops
+        the connection and Ollama aborts decoding. Firing ``cancel`` closes
+        the stream from any thread; the partial reply is then returned with
+        ``done_reason="cancelled"``.
+        """
         url = f"{self.host}/api/chat"
         payload = {
             "model": model,
             "messages": messages,
             "stream": True,
-            "options": {"temperature": 0.1, "top_p": 0.9, "num_predict": 2048}
+            "keep_alive": self.keep_alive,
+            "options": {"temperature": 0.1, "top_p": 0.9, "num_predict": 2048, **(options or {})}
         }
-        
-        response = requests.post(url, json=payload, stream=True)
-        full_response = ""
-        
-        for line in response.iter_lines():
-            if line:
-                data = json.loads(line.decode('utf-8'))
-                if content := data.get("message", {}).get("content"):
-                    full_response += content
-                    yield content
-        
-        yield full_response  # Final complete response
+        if cancel and cancel.cancelled:
+            return GenerationResult("", model, "cancelled")
+
+        # Headers only arrive with the first token, so the initial read
+        # budget covers model load + prompt prefill; a cancel meanwhile
+        # shuts the waiting socket so Ollama stops the prefill too.
+        started = time.perf_counter()
+        in_flight = _InFlight()
+        unregister = cancel.on_cancel(in_flight.abort) if cancel else None
+        try:
+            with in_flight:
+                response = self.session.post(
+                    url, json=payload, stream=True,
+                    timeout=(self.connect_timeout, self.first_token_timeout),
+                )
+        except requests.RequestException:
+            if unregister:
+                unregister()
+            if cancel and cancel.cancelled:
+                return GenerationResult("", model, "cancelled")
+            raise
+        in_flight.attach_response(response)
+        watchdog: Optional[_StallWatchdog] = None
+        parts = []
+        try:
+            if response.status_code >= 400:
+                raise OllamaError(_error_message(response), response.status_code)
+            # After the first token, a read that stalls for read_timeout aborts the stream
+            watchdog = _StallWatchdog(response, self.read_timeout)
+            final: Dict = {}
+
+            for line in response.iter_lines():
+                watchdog.feed()
+                if line:
+                    data = json.loads(line.decode('utf-8'))
+                    if error := data.get("error"):
+                        raise OllamaError(error)
+                    if content := data.get("message", {}).get("content"):
+                        if not parts:
+                            metrics.observe("ollama_ttft_seconds", time.perf_counter() - started, model=model)
+                        parts.append(content)
+                        yield content
+                    if data.get("done"):
+                        final = data
+            watchdog.check()
+
+            result = GenerationResult(
+                "".join(parts), model, final.get("done_reason"),
+                **{field: int(final.get(field) or 0) for field in TIMING_FIELDS},
+            )
+            record_generation(result, time.perf_counter() - started)
+            return result
+        except Exception:
+            if cancel and cancel.cancelled:
+                return GenerationResult("".join(parts), model, "cancelled")
+            if watchdog:
+                watchdog.check()
+            raise
+        finally:
+            if watchdog:
+                watchdog.stop()
+            if unregister:
+                unregister()
+            response.close()
+
+    def embed(self, texts: List[str], model: str = "nomic-embed-text") -> List[List[float]]:
+        """Embed a batch of texts with Ollama's /api/embed endpoint"""
+        response = self.session.post(
+            f"{self.host}/api/embed",
+            json={"model": model, "input": texts, "keep_alive": self.keep_alive},
+            timeout=(self.connect_timeout, self.first_token_timeout),
+        )
+        response.raise_for_status()
+        data = response.json()
+        if error := data.get("error"):
+            raise OllamaError(error)
+        return data["embeddings"]
+
+
+def record_generation(result: GenerationResult, elapsed: float):
+    """Export the timings of one finished generation"""
+    metrics.observe("ollama_generate_seconds", elapsed, model=result.model)
+    metrics.inc("ollama_eval_tokens_total", result.eval_count, model=result.model)
+    metrics.inc("ollama_prompt_tokens_total", result.prompt_eval_count, model=result.model)
+    if result.eval_duration:
+        rate = result.eval_count / (result.eval_duration / 1e9)
+        metrics.observe("decode_tokens_per_second", rate, buckets=RATE_BUCKETS, model=result.model)
+    if result.prompt_eval_duration:
+        metrics.observe("ollama_prompt_eval_seconds", result.prompt_eval_duration / 1e9, model=result.model)
+    if result.load_duration:
+        metrics.observe("ollama_load_seconds", result.load_duration / 1e9, model=result.model)
+
+
+class _StallWatchdog:
+    """Close a streaming response that goes ``timeout`` seconds without a chunk.
+
+    The socket keeps the first-token timeout for every read, so the shorter
+    between-chunk limit is enforced here: ``feed()`` after each chunk pushes
+    the deadline out, and a daemon thread closes the response once it passes.
+    ``check()`` then turns the aborted read into a ``ReadTimeout``.
+    """
+
+    def __init__(self, response: requests.Response, timeout: float):
+        self.timeout = timeout
+        self.stalled = False
+        self._deadline = time.monotonic() + timeout
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(response,), name="ollama-watchdog", daemon=True).start()
+
+    def feed(self):
+        self._deadline = time.monotonic() + self.timeout
+
+    def stop(self):
+        self._done.set()
+
+    def check(self):
+        if self.stalled:
+            raise requests.exceptions.ReadTimeout(f"Ollama sent nothing for {self.timeout:g}s mid-stream")
+
+    def _run(self, response: requests.Response):
+        while not self._done.wait(min(1.0, self.timeout)):
+            if time.monotonic() > self._deadline:
+                self.stalled = True
+                metrics.inc("ollama_stream_stalls_total")
+                _abort(response)
+                return
+
+
+def _error_message(response: requests.Response) -> str:
+    """Ollama's ``{"error": ...}`` body, or the HTTP status line"""
+    try:
+        return response.json()["error"]
+    except (ValueError, KeyError, TypeError):
+        return f"HTTP {response.status_code} {response.reason}"
+
+
+_waiting = threading.local()
+
+
+class _InFlight:
+    """The connection a request on this thread is waiting on, so another
+    thread can abort it before the response headers arrive, and the
+    response once they have"""
+
+    def __init__(self):
+        self.aborted = False
+        self._conn: Optional[HTTPConnection] = None
+        self._response: Optional[requests.Response] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        _waiting.request = self
+        return self
+
+    def __exit__(self, *exc):
+        _waiting.request = None
+        with self._lock:
+            self._conn = None
+
+    def attach_connection(self, conn: HTTPConnection):
+        with self._lock:
+            self._conn = conn
+            aborted = self.aborted
+        if aborted:
+            _shutdown(conn)
+
+    def attach_response(self, response: requests.Response):
+        with self._lock:
+            self._response = response
+            aborted = self.aborted
+        if aborted:
+            _abort(response)
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            conn, response = self._conn, self._response
+        if response is not None:
+            _abort(response)
+        elif conn is not None:
+            _shutdown(conn)
+
+
+class _AbortableConnectionMixin:
+    def getresponse(self, *args, **kwargs):
+        # The request is on the wire; from here until the headers arrive,
+        # only shutting the socket unblocks the read
+        request = getattr(_waiting, "request", None)
+        if request is not None:
+            request.attach_connection(self)
+        return super().getresponse(*args, **kwargs)
+
+
+class _AbortableHTTPConnection(_AbortableConnectionMixin, HTTPConnection):
+    pass
+
+
+class _AbortableHTTPSConnection(_AbortableConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _AbortableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _AbortableHTTPConnection
+
+
+class _AbortableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _AbortableHTTPSConnection
+
+
+class _AbortableAdapter(HTTPAdapter):
+    """``HTTPAdapter`` whose connections can be aborted while awaiting headers"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _AbortableHTTPConnectionPool,
+            "https": _AbortableHTTPSConnectionPool,
+        }
+
+
+def _shutdown(conn: HTTPConnection):
+    try:
+        conn.sock.shutdown(socket.SHUT_RDWR)
+    except (AttributeError, OSError):
+        pass
+
+
+def _abort(response: requests.Response):
+    """Close a streaming response from another thread.
+
+    ``close()`` alone does not wake a read blocked on the socket;
+    ``HTTPResponse.shutdown()`` (urllib3 >= 2.3) does.
+    """
+    try:
+        response.raw.shutdown()
+    except (AttributeError, ValueError, RuntimeError, OSError):
+        pass
+    response.close()
+
 
 # Global client instance
 ollama = OllamaClient()
@@ -0,0 +1,327 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import AsyncExitStack, ExitStack
+from typing import AsyncGenerator, Dict, Generator, List, Optional, Union
+
+import requests
+
+from ai.async_client import AsyncOllamaClient
+from ai.cancel import CancelToken
+from ai.ollama_client import GenerationResult, OllamaClient, OllamaError, ServerHealth, model_key, ollama
+from ai.scheduler import FairScheduler, QueueFull, WaitCallback, for_backend
+
+
+class NoBackendAvailable(RuntimeError):
+    """Raised when every backend failed before producing a token"""
+
+
+def _status(error: Exception) -> Optional[int]:
+    return getattr(getattr(error, "response", None), "status_code", None) or getattr(error, "status", None)
+
+
+def is_model_missing(error: Exception) -> bool:
+    """The backend doesn't have the model; another one may"""
+    return _status(error) == 404 or (isinstance(error, OllamaError) and "not found" in str(error).lower())
+
+
+def is_request_error(error: Exception) -> bool:
+    """The request itself is wrong (bad payload, options): another backend
+    won't do better, and this one isn't at fault"""
+    status = _status(error)
+    return bool(status and 400 <= status < 500 and status not in (404, 408, 429))
+
+
+class Backend:
+    """One Ollama host with its own scheduler, health and throughput estimate"""
+
+    def __init__(self, client: OllamaClient, scheduler: FairScheduler):
+        self.client = client
+        self.scheduler = scheduler
+        self.tokens_per_sec = 0.0          # EWMA of decode speed, 0 until measured
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self._aclient: Optional[AsyncOllamaClient] = None
+
+    @property
+    def host(self) -> str:
+        return self.client.host
+
+    @property
+    def aclient(self) -> AsyncOllamaClient:
+        """asyncio client for the same host, created on first use"""
+        if self._aclient is None:
+            c = self.client
+            self._aclient = AsyncOllamaClient(
+                c.host, c.connect_timeout, c.read_timeout, c.first_token_timeout, keep_alive=c.keep_alive,
+            )
+        return self._aclient
+
+    def load(self) -> float:
+        """Outstanding requests (running + queued) per slot"""
+        snapshot = self.scheduler.snapshot()
+        return (snapshot["active"] + snapshot["queued"]) / snapshot["max_concurrent"]
+
+    def record_success(self, tokens: int, decode_seconds: float):
+        self.failures = 0
+        if tokens > 1 and decode_seconds > 0:
+            rate = tokens / decode_seconds
+            self.tokens_per_sec = rate if not self.tokens_per_sec else self.tokens_per_sec + 0.2 * (rate - self.tokens_per_sec)
+
+
+class BackendPool:
+    """Route generations across several Ollama hosts.
+
+    Healthy backends that list the model are preferred, those that already
+    have it loaded (``/api/ps``) first, to avoid model-swap stalls. Among
+    those the policy picks the least outstanding requests per slot or, with
+    ``policy="throughput"``, the best expected decode speed. A backend is
+    ejected after ``eject_after`` consecutive failures and re-admitted once
+    a health probe succeeds after its cool-down. A stream that fails before
+    its first token is retried on the next backend transparently, as is
+    one whose queue is full. A backend without the model is skipped
+    without counting against it, in favour of backends that list the
+    model. Other errors in the request itself (4xx) go straight to the
+    caller and don't count against the backend either.
+    """
+
+    def __init__(
+        self,
+        clients: List[OllamaClient],
+        policy: str = "least_outstanding",
+        eject_after: int = 2,
+        cooldown: float = 15.0,
+        max_cooldown: float = 120.0,
+    ):
+        self.backends = [Backend(c, for_backend(c.host)) for c in clients]
+        self.policy = policy
+        self.eject_after = eject_after
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+
+    @property
+    def host(self) -> str:
+        return ",".join(b.host for b in self.backends)
+
+    # ---------- HEALTH ----------
+    def health(self, wait: float = 1.0) -> ServerHealth:
+        """Aggregate health: running if any backend is, models of all backends"""
+        states = [b.client.health(wait) for b in self._admitted()]
+        running = True if any(h.running for h in states) else (None if any(h.running is None for h in states) else False)
+        models = tuple(sorted({m for h in states for m in h.models}))
+        loaded = tuple(sorted({m for h in states for m in h.loaded}))
+        checked = max((h.checked_at for h in states), default=float("-inf"))
+        return ServerHealth(running, models, checked, loaded)
+
+    def get_models(self) -> List[str]:
+        return list(self.health().models)
+
+    def is_running(self) -> bool:
+        return bool(self.health().running)
+
+    # ---------- MODEL LIFECYCLE ----------
+    def preload(self, model: str):
+        """Start loading ``model`` on every backend in rotation"""
+        for backend in self._admitted():
+            backend.client.preload(model)
+
+    def load_state(self, model: str) -> str:
+        """Best load state of ``model`` across the backends in rotation"""
+        states = {b.client.load_state(model) for b in self._admitted()}
+        return next(s for s in ("loaded", "loading", "cold") if s in states or s == "cold")
+
+    def _admitted(self) -> List[Backend]:
+        now = time.monotonic()
+        admitted = []
+        for backend in self.backends:
+            if backend.ejected_until > now:
+                continue
+            if backend.ejected_until:
+                # Cool-down over: re-admit only on a probe taken after it
+                health = backend.client.health(wait=0)
+                if health.checked_at < backend.ejected_until:
+                    backend.client.refresh_health(wait=0)
+                    continue
+                if not health.running:
+                    continue
+                backend.ejected_until = 0.0
+            admitted.append(backend)
+        return admitted or self.backends
+
+    def _record_failure(self, backend: Backend):
+        with self._lock:
+            backend.failures += 1
+            if backend.failures >= self.eject_after:
+                backend.ejections += 1
+                backoff = min(self.max_cooldown, self.cooldown * 2 ** (backend.ejections - 1))
+                backend.ejected_until = time.monotonic() + backoff
+                backend.failures = 0
+
+    # ---------- ROUTING ----------
+    def _next_backend(
+        self, model: str, tried: List[Backend], last_error: Optional[Exception], missing: Optional[Exception]
+    ) -> Backend:
+        """Best backend not tried yet for this request; once one turned out
+        not to have the model, only backends that list it"""
+        ranked = self._ranked(model, tried)
+        if missing is not None:
+            ranked = [b for b in ranked if _lists(b.client.health(wait=0), model)]
+        if not ranked:
+            if isinstance(last_error, QueueFull):
+                raise last_error        # every backend is full, none failed
+            if missing is not None:
+                raise missing           # no backend has the model
+            raise NoBackendAvailable(f"All Ollama backends failed: {last_error}")
+        tried.append(ranked[0])
+        return ranked[0]
+
+    def _ranked(self, model: str, exclude: List[Backend]) -> List[Backend]:
+        candidates = [b for b in self._admitted() if b not in exclude]
+
+        def key(backend: Backend):
+            health = backend.client.health(wait=0)
+            has_model = health.running is not False and (not health.models or _lists(health, model))
+            loaded = model_key(model) in {model_key(m) for m in health.loaded}
+            if self.policy == "throughput" and backend.tokens_per_sec:
+                cost = (backend.load() + 1) / backend.tokens_per_sec
+            else:
+                cost = backend.load()
+            return (not has_model, not loaded, cost)
+
+        return sorted(candidates, key=key)
+
+    def generate(
+        self,
+        messages: List[Dict],
+        model: str = "llama3.2",
+        options: Optional[Dict] = None,
+        session_id: str = "",
+        on_wait: Optional[WaitCallback] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Generator[str, None, GenerationResult]:
+        """Same protocol as ``OllamaClient.generate``, with routing, admission
+        control and failover before the first token"""
+        tried: List[Backend] = []
+        last_error: Optional[Exception] = None
+        missing: Optional[Exception] = None
+        while True:
+            if cancel and cancel.cancelled:
+                return GenerationResult("", model, "cancelled")
+            backend = self._next_backend(model, tried, last_error, missing)
+            with ExitStack() as held:
+                try:
+                    held.enter_context(backend.scheduler.slot(session_id, on_wait, cancel))
+                except QueueFull as e:
+                    last_error = e
+                    continue
+                stream = backend.client.generate(messages, model, options, cancel)
+                try:
+                    first = next(stream)
+                except StopIteration as stop:
+                    backend.record_success(0, 0.0)
+                    return stop.value
+                except (requests.RequestException, OllamaError) as e:
+                    stream.close()
+                    if is_model_missing(e):
+                        missing = last_error = e
+                        continue
+                    if is_request_error(e):
+                        raise
+                    self._record_failure(backend)
+                    last_error = e
+                    continue
+
+                started = time.monotonic()
+                tokens = 1
+                try:
+                    yield first
+                    while True:
+                        try:
+                            delta = next(stream)
+                        except StopIteration as stop:
+                            backend.record_success(tokens, time.monotonic() - started)
+                            return stop.value
+                        except (requests.RequestException, OllamaError) as e:
+                            if not (is_request_error(e) or is_model_missing(e)):
+                                self._record_failure(backend)   # too late to fail over
+                            raise
+                        tokens += 1
+                        yield delta
+                finally:
+                    stream.close()
+
+    async def agenerate(
+        self,
+        messages: List[Dict],
+        model: str = "llama3.2",
+        options: Optional[Dict] = None,
+        session_id: str = "",
+        on_wait: Optional[WaitCallback] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> AsyncGenerator[Union[str, GenerationResult], None]:
+        """Async ``generate``: yields deltas then the ``GenerationResult``
+        (the ``AsyncOllamaClient`` protocol). Shares schedulers, health and
+        ejection state with the threaded path."""
+        tried: List[Backend] = []
+        last_error: Optional[Exception] = None
+        missing: Optional[Exception] = None
+        while True:
+            if cancel and cancel.cancelled:
+                yield GenerationResult("", model, "cancelled")
+                return
+            backend = self._next_backend(model, tried, last_error, missing)
+            async with AsyncExitStack() as held:
+                try:
+                    await held.enter_async_context(backend.scheduler.aslot(session_id, on_wait, cancel))
+                except QueueFull as e:
+                    last_error = e
+                    continue
+                stream = backend.aclient.generate(messages, model, options)
+                try:
+                    first = await stream.__anext__()
+                except (OSError, asyncio.TimeoutError, OllamaError) as e:
+                    await stream.aclose()
+                    if is_model_missing(e):
+                        missing = last_error = e
+                        continue
+                    if is_request_error(e):
+                        raise
+                    self._record_failure(backend)
+                    last_error = e
+                    continue
+
+                started = time.monotonic()
+                tokens = 0
+                try:
+                    item = first
+                    while True:
+                        if isinstance(item, GenerationResult):
+                            backend.record_success(tokens, time.monotonic() - started)
+                            yield item
+                            return
+                        tokens += 1
+                        yield item
+                        try:
+                            item = await stream.__anext__()
+                        except (OSError, asyncio.TimeoutError, OllamaError) as e:
+                            if not (is_request_error(e) or is_model_missing(e)):
+                                self._record_failure(backend)   # too late to fail over
+                            raise
+                finally:
+                    await stream.aclose()
+
+
+def _lists(health: ServerHealth, model: str) -> bool:
+    return model_key(model) in {model_key(m) for m in health.models}
+
+
+def _clients_from_env() -> List[OllamaClient]:
+    hosts = [h.strip().rstrip("/") for h in os.environ.get("OLLAMA_HOSTS", ollama.host).split(",") if h.strip()]
+    return [ollama if host == ollama.host else OllamaClient(host) for host in hosts]
+
+
+# Global backend pool (OLLAMA_HOSTS="http://a:11434,http://b:11434")
+backend_pool = BackendPool(_clients_from_env())
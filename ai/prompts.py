@@ -0,0 +1,19 @@
+# System prompts are module constants so every turn sends byte-identical text
+# and Ollama can reuse the cached prefix.
+import hashlib
+
+SYSTEM_PROMPT = (
+    "You are SmartBank AI, a professional banking assistant for Indian customers.\n"
+    "Use ₹ symbol for Indian Rupees. Sample balances: Savings ₹3,45,200.\n"
+    "Services: balance, transfer, statement, cards, EMI, security.\n"
+    "Always respond as a bank officer."
+)
+
+# Changes whenever the shared prefix changes (shown in the admin panel)
+SYSTEM_PROMPT_HASH = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+SUMMARY_PROMPT = (
+    "Summarise the earlier part of this banking conversation for the assistant's memory. "
+    "Keep account types, amounts, dates, reference numbers and any unresolved requests. "
+    "Write plain sentences, at most {max_words} words."
+)
@@ -0,0 +1,315 @@
+"""Local knowledge base: bank policy / FAQ documents retrieved into the prompt.
+
+Build or refresh the index from the command line:
+
+    python -m ai.retrieval build [--docs knowledge] [--index .kb_index]
+    python -m ai.retrieval query "how long does NEFT take"
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from ai.cache import hashed_embedding
+
+DOC_SUFFIXES = {".md", ".txt"}
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+class Chunk(NamedTuple):
+    source: str
+    text: str
+    score: float
+
+
+class _Index(NamedTuple):
+    """One loaded build of the index; replaced whole, never modified"""
+    vectors: np.ndarray
+    offsets: np.ndarray
+    chunks: bytes               # mmap of chunks.txt (or b"")
+    sources: List[str]
+    centroids: Optional[np.ndarray]
+    lists: List[np.ndarray]
+
+
+def embedder_id(embedder: Callable) -> str:
+    """Identity recorded in the manifest, so vectors from another embedder are never reused"""
+    if tagged := getattr(embedder, "embedder_id", None):
+        return tagged
+    func = getattr(embedder, "func", embedder)      # functools.partial
+    name = f"{func.__module__}.{getattr(func, '__qualname__', type(func).__qualname__)}"
+    keywords = getattr(embedder, "keywords", None)
+    return f"{name}{sorted(keywords.items())}" if keywords else name
+
+
+def chunk_text(text: str, max_chars: int = 800) -> List[str]:
+    """Split on blank lines, packing paragraphs up to ``max_chars``"""
+    chunks, current = [], ""
+    for para in (p.strip() for p in re.split(r"\n\s*\n", text)):
+        if not para:
+            continue
+        pieces = [para] if len(para) <= max_chars else SENTENCE_RE.split(para)
+        for piece in pieces:
+            while len(piece) > max_chars:
+                chunks.append(piece[:max_chars])
+                piece = piece[max_chars:]
+            if current and len(current) + len(piece) + 2 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _kmeans(vectors: np.ndarray, n_lists: int, iterations: int = 8, sample: int = 50_000) -> np.ndarray:
+    """Spherical k-means centroids trained on a sample of ``vectors``"""
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(vectors), size=min(len(vectors), sample), replace=False)
+    data = np.asarray(vectors[np.sort(rows)], dtype=np.float32)
+    centroids = data[rng.choice(len(data), size=n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        for j in range(n_lists):
+            members = data[assign == j]
+            if len(members):
+                c = members.sum(axis=0)
+                centroids[j] = c / max(np.linalg.norm(c), 1e-9)
+    return centroids
+
+
+class KnowledgeBase:
+    """Chunked, embedded documents searched by vectorised dot products.
+
+    Vectors live in ``vectors.npy`` and chunk texts in ``chunks.txt`` (with
+    byte offsets in ``offsets.npy``); both are memory-mapped, so loading the
+    index is cheap regardless of corpus size. Rebuilds only re-embed files
+    whose content hash changed, and only while the embedder is the same.
+    A rebuild swaps the loaded index in whole, so searches running at the
+    time finish on the old one. Corpora above ``ivf_min_rows`` chunks also
+    get IVF partitioning: queries score the centroids first and then scan
+    only the ``nprobe`` closest lists.
+    """
+
+    def __init__(
+        self,
+        docs_dir: str,
+        index_dir: str,
+        embedder: Callable[[List[str]], np.ndarray] = hashed_embedding,
+        batch_size: int = 64,
+        ivf_min_rows: int = 20_000,
+        nprobe: int = 8,
+    ):
+        self.docs_dir = Path(docs_dir)
+        self.index_dir = Path(index_dir)
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self.embedder_id = embedder_id(embedder)
+        self._index: Optional[_Index] = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._building: Optional[threading.Thread] = None
+
+    # ---------- BUILD ----------
+    def build(self) -> Dict[str, int]:
+        """(Re)build the index, re-embedding only new or changed files"""
+        with self._build_lock:
+            return self._build()
+
+    def _build(self) -> Dict[str, int]:
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.index_dir / "manifest.json"
+        old = json.loads(manifest_path.read_text()) if manifest_path.exists() else {"files": {}}
+        if old.get("embedder") != self.embedder_id:
+            old = {"files": {}}     # vectors from another embedder are not comparable
+        old_vectors = self._open("vectors.npy") if old["files"] else None
+        old_offsets = self._open("offsets.npy")
+        old_texts = (self.index_dir / "chunks.txt").read_bytes() if old_vectors is not None else b""
+
+        files, texts, sources, vector_parts = {}, [], [], []
+        stats = {"files": 0, "reused": 0, "embedded": 0}
+        paths = sorted(p for p in self.docs_dir.rglob("*") if p.suffix.lower() in DOC_SUFFIXES)
+        for path in paths:
+            rel = path.relative_to(self.docs_dir).as_posix()
+            raw = path.read_bytes()
+            sha = hashlib.sha256(raw).hexdigest()
+            start = len(texts)
+            previous = old["files"].get(rel)
+            if previous and previous["sha"] == sha and old_vectors is not None:
+                lo, hi = previous["rows"]
+                texts.extend(old_texts[old_offsets[i, 0]:old_offsets[i, 1]].decode("utf-8") for i in range(lo, hi))
+                vector_parts.append(np.asarray(old_vectors[lo:hi]))
+                stats["reused"] += hi - lo
+            else:
+                chunks = chunk_text(raw.decode("utf-8", errors="replace"))
+                texts.extend(chunks)
+                for i in range(0, len(chunks), self.batch_size):
+                    vector_parts.append(np.asarray(self.embedder(chunks[i:i + self.batch_size]), dtype=np.float32))
+                stats["embedded"] += len(chunks)
+            sources.extend([rel] * (len(texts) - start))
+            files[rel] = {"sha": sha, "rows": [start, len(texts)]}
+            stats["files"] += 1
+
+        vectors = np.concatenate(vector_parts) if vector_parts else np.zeros((0, 1), dtype=np.float32)
+        encoded = [t.encode("utf-8") for t in texts]
+        ends = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+        offsets = np.stack([ends - [len(b) for b in encoded], ends], axis=1) if encoded else np.zeros((0, 2), np.int64)
+
+        # Release the old maps before replacing their files
+        del old_vectors, old_offsets
+        self._write("vectors.npy", lambda f: np.save(f, vectors))
+        self._write("offsets.npy", lambda f: np.save(f, offsets))
+        self._write("chunks.txt", lambda f: f.write(b"".join(encoded)))
+        if len(vectors) >= self.ivf_min_rows:
+            n_lists = int(np.sqrt(len(vectors)))
+            centroids = _kmeans(vectors, n_lists)
+            assign = np.concatenate([
+                np.argmax(vectors[i:i + 8192] @ centroids.T, axis=1) for i in range(0, len(vectors), 8192)
+            ]).astype(np.int32)
+            self._write("centroids.npy", lambda f: np.save(f, centroids))
+            self._write("assign.npy", lambda f: np.save(f, assign))
+        else:
+            for name in ("centroids.npy", "assign.npy"):
+                (self.index_dir / name).unlink(missing_ok=True)
+        manifest = {"embedder": self.embedder_id, "dim": int(vectors.shape[1]), "files": files, "sources": sources}
+        self._write("manifest.json", lambda f: f.write(json.dumps(manifest).encode()))
+
+        index = self._read_index()
+        with self._lock:
+            self._index = index
+        return stats
+
+    def _write(self, name: str, dump: Callable):
+        tmp = self.index_dir / f"{name}.tmp"
+        with open(tmp, "wb") as f:
+            dump(f)
+        os.replace(tmp, self.index_dir / name)
+
+    def _open(self, name: str) -> Optional[np.ndarray]:
+        path = self.index_dir / name
+        return np.load(path, mmap_mode="r") if path.exists() else None
+
+    # ---------- QUERY ----------
+    def _read_index(self) -> Optional[_Index]:
+        """Map the files on disk; None when missing or built by another embedder"""
+        manifest_path = self.index_dir / "manifest.json"
+        if not manifest_path.exists():
+            return None
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("embedder") != self.embedder_id:
+            return None
+        with open(self.index_dir / "chunks.txt", "rb") as f:
+            chunks = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        centroids = self._open("centroids.npy")
+        assign = self._open("assign.npy")
+        lists: List[np.ndarray] = []
+        if centroids is not None and assign is not None:
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+            lists = [order[bounds[j]:bounds[j + 1]] for j in range(len(centroids))]
+        else:
+            centroids = None
+        return _Index(self._open("vectors.npy"), self._open("offsets.npy"), chunks, manifest["sources"], centroids, lists)
+
+    def _load(self) -> Optional[_Index]:
+        """The current index. A missing or stale one is (re)built on a
+        background thread, and searches find nothing until it lands."""
+        if self._index is not None:
+            return self._index
+        with self._lock:
+            if self._index is None:
+                self._index = self._read_index()
+            if self._index is None and self.docs_dir.is_dir() and self._building is None:
+                self._building = threading.Thread(target=self._build_in_background, name="kb-build", daemon=True)
+                self._building.start()
+            return self._index
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        finally:
+            with self._lock:
+                self._building = None
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.2) -> List[Chunk]:
+        index = self._load()
+        if index is None or not len(index.vectors):
+            return []
+        q = np.asarray(self.embedder([query])[0], dtype=np.float32)
+        if q.shape[0] != index.vectors.shape[1]:
+            raise ValueError(f"query vector has {q.shape[0]} dimensions, the index {index.vectors.shape[1]}")
+        if index.centroids is not None:
+            lists = np.argpartition(-(index.centroids @ q), min(self.nprobe, len(index.lists) - 1))[:self.nprobe]
+            rows = np.sort(np.concatenate([index.lists[j] for j in lists]))
+            scores = index.vectors[rows] @ q
+        else:
+            rows = None
+            scores = index.vectors @ q
+        if not len(scores):
+            return []
+        top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+        top = top[np.argsort(-scores[top])]
+
+        hits = []
+        for i in top:
+            if scores[i] < min_score:
+                break
+            row = int(rows[i]) if rows is not None else int(i)
+            start, end = index.offsets[row]
+            hits.append(Chunk(index.sources[row], index.chunks[start:end].decode("utf-8"), float(scores[i])))
+        return hits
+
+    def augment(self, messages: List[Dict], query: str, k: int = 3) -> List[Dict]:
+        """Insert retrieved chunks just before the final user message.
+
+        They go at the end rather than into the system prompt so the cached
+        prompt prefix is unchanged.
+        """
+        try:
+            hits = self.search(query, k)
+        except Exception:
+            return messages  # a broken index must not fail the chat turn
+        if not hits:
+            return messages
+        facts = "\n\n".join(f"[{hit.source}]\n{hit.text}" for hit in hits)
+        note = {"role": "system", "content": f"Relevant SmartBank policy excerpts:\n\n{facts}"}
+        return messages[:-1] + [note] + messages[-1:]
+
+
+# Global knowledge base
+knowledge_base = KnowledgeBase(
+    os.environ.get("SMARTBANK_KB", "knowledge"),
+    os.environ.get("SMARTBANK_KB_INDEX", ".kb_index"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartBank knowledge base index")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("text", nargs="?", default="")
+    parser.add_argument("--docs", default=str(knowledge_base.docs_dir))
+    parser.add_argument("--index", default=str(knowledge_base.index_dir))
+    parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    kb = KnowledgeBase(args.docs, args.index)
+    if args.command == "build":
+        print(json.dumps(kb.build()))
+    else:
+        if kb._read_index() is None:
+            kb.build()
+        for hit in kb.search(args.text, args.k, min_score=0.0):
+            print(f"{hit.score:.3f}  {hit.source}\n{hit.text}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+LLM_FALLBACK = "llm"
+
+# Words that carry no intent of their own; they don't count against coverage
+FILLER_WORDS = frozenset("""
+a an the my me i is am are was what whats what's how much many can could you please pls
+tell show check give get know want to of for in on at and or do does did have has our your
+this that it its kindly sir madam ji bata batao hai kya mera meri
+""".split())
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+class Intent(NamedTuple):
+    name: str
+    handler: Callable[[str], str]
+    confidence: float
+    exhaustive: bool = False    # only answer when the match covers every content word
+
+
+class RouteMatch(NamedTuple):
+    intent: str
+    confidence: float
+    response: str
+
+
+class IntentRouter:
+    """Answer common intents deterministically before the LLM is involved.
+
+    All intent patterns are compiled into one alternation with a named group
+    per intent, so routing is a single regex scan however many intents are
+    registered. Confidence is the intent's base confidence scaled by how much
+    of the message (ignoring filler words) the match covers; anything below
+    ``threshold`` falls through to the LLM. An ``exhaustive`` intent only
+    answers when nothing else was asked: its canned reply is about one
+    specific thing ("IFSC code of Pune branch" is not about the home branch).
+    """
+
+    def __init__(self, threshold: float = 0.6):
+        self.threshold = threshold
+        self.hits = Counter()
+        self._intents: Dict[str, Intent] = {}   # keyed by regex group name
+        self._by_name: Dict[str, Intent] = {}
+        self._patterns: List[str] = []
+        self._regex: Optional[re.Pattern] = None
+        self._lock = threading.Lock()
+
+    def register(
+        self, name: str, patterns: List[str], handler: Callable[[str], str],
+        confidence: float = 1.0, exhaustive: bool = False,
+    ):
+        group = f"i{len(self._intents)}"
+        self._intents[group] = self._by_name[name] = Intent(name, handler, confidence, exhaustive)
+        self._patterns.append(f"(?P<{group}>\\b(?:{'|'.join(patterns)})\\b)")
+        self._regex = None
+
+    def intent(self, name: str, *patterns: str, confidence: float = 1.0, exhaustive: bool = False):
+        """Decorator form of ``register``"""
+        def wrap(handler: Callable[[str], str]):
+            self.register(name, list(patterns), handler, confidence, exhaustive)
+            return handler
+        return wrap
+
+    def match(self, text: str) -> Optional[RouteMatch]:
+        """Best intent for ``text`` without calling its handler or counting a hit"""
+        if self._regex is None:
+            self._regex = re.compile("|".join(self._patterns), re.IGNORECASE)
+        text_lower = text.lower()
+        # A message of filler words only still matches a pattern made of
+        # them ("what can you do"); it just can't dilute the coverage
+        words = [w for w in WORD_RE.findall(text_lower) if w not in FILLER_WORDS]
+
+        covered: Dict[str, int] = {}
+        for m in self._regex.finditer(text_lower):
+            group = m.lastgroup
+            span_words = [w for w in WORD_RE.findall(m.group()) if w not in FILLER_WORDS]
+            covered[group] = covered.get(group, 0) + max(len(span_words), 1)
+        if not covered:
+            return None
+
+        group = max(covered, key=covered.get)
+        intent = self._intents[group]
+        coverage = min(1.0, covered[group] / max(len(words), 1))
+        if intent.exhaustive and coverage < 1.0:
+            coverage = 0.0  # asked about something the canned answer doesn't know
+        confidence = intent.confidence * coverage
+        if len(covered) > 1:
+            confidence *= 0.5  # several intents in one message: let the LLM handle it
+        return RouteMatch(intent.name, confidence, "")
+
+    def route(self, text: str) -> Optional[RouteMatch]:
+        """Return a handled response, or None (and count an LLM fallback)"""
+        found = self.match(text)
+        if found is None or found.confidence < self.threshold:
+            self._count(LLM_FALLBACK)
+            return None
+        self._count(found.intent)
+        return found._replace(response=self._by_name[found.intent].handler(text))
+
+    def _count(self, name: str):
+        with self._lock:
+            self.hits[name] += 1
+
+
+router = IntentRouter()
+
+
+@router.intent("greeting", r"hi+", r"hello+", r"hey+", r"namaste", r"good (?:morning|afternoon|evening)")
+def _greeting(text: str) -> str:
+    return "🙏 Namaste! I'm your SmartBank virtual officer. Ask me about balances, transfers, cards or loans."
+
+
+@router.intent("balance", r"(?:account |savings |current )?balance(?: enquiry| inquiry)?", r"bal")
+def _balance(text: str) -> str:
+    return "💰 Quick balance:\n• Savings: ₹3,45,200 | Current: ₹2,10,500"
+
+
+@router.intent("help", r"help", r"menu", r"options", r"what can you do")
+def _help(text: str) -> str:
+    return "✅ Use this chat to ask any banking questions!\n💳 Accounts • 💸 Transfers • 💳 Cards • 🏠 Loans"
+
+
+@router.intent(
+    "ifsc", r"ifsc(?: code)?", r"branch(?: code| address| details)?", r"micr(?: code)?", exhaustive=True,
+)
+def _ifsc(text: str) -> str:
+    return (
+        "🏦 **Home branch:** SmartBank, MG Road, Bengaluru\n"
+        "• IFSC: SMBK0000123 • MICR: 560123002\n"
+        "• Hours: Mon–Sat, 10:00–16:00 (closed 2nd & 4th Saturday)"
+    )
@@ -0,0 +1,268 @@
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Generator, Iterator, Optional
+from ai.cancel import CancelToken
+from ai.metrics import metrics
+
+WaitCallback = Callable[[int, float], None]
+
+
+class Overloaded(RuntimeError):
+    """Raised when a request is shed instead of queued"""
+
+
+class QueueFull(Overloaded):
+    """``Overloaded`` at admission: the request never queued, so another backend may take it"""
+
+
+class Ticket:
+    __slots__ = ("session_id", "enqueued_at", "granted", "on_grant")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.on_grant: Optional[Callable[[], None]] = None   # wakes an asyncio waiter
+
+
+class FairScheduler:
+    """Admission control in front of one inference backend.
+
+    At most ``max_concurrent`` generations run at once. Everyone else waits
+    in a per-session queue and slots are handed out round-robin across
+    sessions, so a session with several queued requests can't starve the
+    rest. Once ``max_queue`` requests are waiting, new ones are rejected
+    with ``Overloaded`` instead of piling onto the backend.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 4,
+        max_queue: int = 32,
+        max_wait: float = 90.0,
+        poll_interval: float = 0.5,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.stats = Counter()
+        self._active = 0
+        self._queued = 0
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        self._service_time = 10.0           # EWMA of slot hold time, seconds
+        self._waits: Deque[float] = deque(maxlen=512)
+        self._cond = threading.Condition()
+
+    # ---------- ADMISSION ----------
+    def acquire(self, session_id: str, on_wait: Optional[WaitCallback] = None, cancel: Optional[CancelToken] = None):
+        """Block until a slot is free; ``on_wait(position, eta_seconds)`` is
+        called from this thread while queued, and with position 0 when the
+        slot is granted after waiting. Raises ``Cancelled`` if ``cancel``
+        fires first."""
+        with self._cond:
+            ticket = self._admit_locked(session_id)
+        if ticket is None:
+            return
+
+        deadline = ticket.enqueued_at + self.max_wait
+        try:
+            while True:
+                with self._cond:
+                    if not ticket.granted:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._time_out()
+                        self._cond.wait(min(self.poll_interval, remaining))
+                    if ticket.granted:
+                        self._record_wait(time.monotonic() - ticket.enqueued_at)
+                        break
+                    if cancel:
+                        cancel.raise_if_cancelled()
+                    position, eta = self._position(ticket)
+                if on_wait:
+                    on_wait(position, eta)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        if on_wait:
+            on_wait(0, 0.0)
+
+    def _admit_locked(self, session_id: str) -> Optional[Ticket]:
+        """Take a free slot (None) or queue a ticket; raises ``Overloaded`` when full"""
+        if self._active < self.max_concurrent and not self._queued:
+            self._active += 1
+            self._record_wait(0.0)
+            return None
+        if self._queued >= self.max_queue:
+            self.stats["rejected"] += 1
+            metrics.inc("requests_shed_total")
+            raise QueueFull("SmartBank AI is handling a lot of requests right now. Please try again in a minute.")
+        ticket = Ticket(session_id)
+        self._queues.setdefault(session_id, deque()).append(ticket)
+        self._queued += 1
+        self.stats["enqueued"] += 1
+        return ticket
+
+    def _time_out(self):
+        self.stats["timed_out"] += 1
+        raise Overloaded("SmartBank AI is busy and your request waited too long. Please try again.")
+
+    def _abandon(self, ticket: Ticket):
+        """Give up a ticket: leave the queue, or hand back the slot it was just granted"""
+        with self._cond:
+            if ticket.granted:
+                self._release_locked(0.0)
+            else:
+                queue = self._queues[ticket.session_id]
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.session_id]
+                self._queued -= 1
+
+    def release(self, held_for: float):
+        with self._cond:
+            self._release_locked(held_for)
+
+    def _release_locked(self, held_for: float):
+        if held_for > 0:
+            self._service_time += 0.2 * (held_for - self._service_time)
+        self._active -= 1
+        self.stats["served"] += 1
+        while self._active < self.max_concurrent and self._queues:
+            session_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_id)   # round-robin
+            else:
+                del self._queues[session_id]
+            ticket.granted = True
+            self._active += 1
+            self._queued -= 1
+            if ticket.on_grant:
+                ticket.on_grant()
+        self._cond.notify_all()
+
+    def _position(self, ticket: Ticket) -> "tuple[int, float]":
+        """1-based place in dispatch order and the estimated wait for it"""
+        own = self._queues[ticket.session_id]
+        index = own.index(ticket)
+        ahead = index
+        before_own = True
+        for session_id, queue in self._queues.items():
+            if session_id == ticket.session_id:
+                before_own = False
+                continue
+            ahead += min(len(queue), index + 1 if before_own else index)
+        rounds = math.floor(ahead / self.max_concurrent) + 1
+        return ahead + 1, rounds * self._service_time
+
+    def _record_wait(self, seconds: float):
+        self._waits.append(seconds)
+        metrics.observe("queue_wait_seconds", seconds)
+
+    # ---------- HELPERS ----------
+    @contextmanager
+    def slot(
+        self, session_id: str, on_wait: Optional[WaitCallback] = None, cancel: Optional[CancelToken] = None
+    ) -> Iterator[None]:
+        self.acquire(session_id, on_wait, cancel)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def aslot(
+        self, session_id: str, on_wait: Optional[WaitCallback] = None, cancel: Optional[CancelToken] = None
+    ) -> AsyncIterator[None]:
+        """``slot`` for coroutines. A queued coroutine waits on a future that
+        ``release`` resolves from whichever thread frees the slot, so no
+        thread is parked per waiter. ``on_wait`` is called on the loop."""
+        import asyncio   # only the API's event loop takes this path
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            ticket = self._admit_locked(session_id)
+            if ticket is not None:
+                granted = loop.create_future()
+                ticket.on_grant = lambda: _wake(loop, granted)
+        if ticket is not None:
+            deadline = ticket.enqueued_at + self.max_wait
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        with self._cond:
+                            if not ticket.granted:
+                                self._time_out()
+                    try:
+                        await asyncio.wait_for(asyncio.shield(granted), max(0.0, min(self.poll_interval, remaining)))
+                    except asyncio.TimeoutError:
+                        pass
+                    with self._cond:
+                        if ticket.granted:
+                            self._record_wait(time.monotonic() - ticket.enqueued_at)
+                            break
+                        if cancel:
+                            cancel.raise_if_cancelled()
+                        position, eta = self._position(ticket)
+                    if on_wait:
+                        on_wait(position, eta)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+            if on_wait:
+                on_wait(0, 0.0)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stream(self, session_id: str, open_stream: Callable[[], Generator], on_wait: Optional[WaitCallback] = None):
+        """Wrap a generation stream so it holds a slot from first read to close"""
+        with self.slot(session_id, on_wait):
+            return (yield from open_stream())
+
+    def snapshot(self) -> Dict[str, float]:
+        """Queue depth and wait-time metrics"""
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                "active": self._active,
+                "queued": self._queued,
+                "max_concurrent": self.max_concurrent,
+                "service_time_s": round(self._service_time, 2),
+                "wait_p50_s": round(waits[len(waits) // 2], 3) if waits else 0.0,
+                "wait_p95_s": round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0,
+                **self.stats,
+            }
+
+
+def _wake(loop, future):
+    """Resolve an asyncio waiter's future from any thread"""
+    def resolve():
+        if not future.done():
+            future.set_result(None)
+    try:
+        loop.call_soon_threadsafe(resolve)
+    except RuntimeError:    # the loop has closed; nobody is waiting
+        pass
+
+
+_schedulers: Dict[str, FairScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def for_backend(host: str, max_concurrent: Optional[int] = None) -> FairScheduler:
+    """The process-wide scheduler guarding ``host``"""
+    with _schedulers_lock:
+        if host not in _schedulers:
+            limit = max_concurrent or int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+            _schedulers[host] = FairScheduler(max_concurrent=limit)
+        return _schedulers[host]
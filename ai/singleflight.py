@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+from typing import AsyncGenerator, Callable, Dict, Generator, List, Optional, Union
+
+from ai.cache import normalise
+from ai.cancel import CancelToken
+from ai.metrics import metrics
+from ai.ollama_client import GenerationResult
+from ai.scheduler import WaitCallback
+
+OpenStream = Callable[[CancelToken, WaitCallback], Generator[str, None, GenerationResult]]
+OpenAsyncStream = Callable[[WaitCallback], AsyncGenerator[Union[str, GenerationResult], None]]
+
+
+def flight_key(prompt: str, model: str, messages: List[Dict]) -> str:
+    """Requests with the same normalised prompt, model and context share a flight.
+
+    The context is every message sent to the model except the final user
+    message, whose normalised text stands in for it.
+    """
+    digest = hashlib.sha256(f"{model}\x1f{normalise(prompt)}".encode("utf-8"))
+    for message in messages[:-1]:
+        digest.update(f"\x1e{message['role']}\x1f{message['content']}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class Flight:
+    """One upstream generation and the deltas it has produced so far"""
+
+    def __init__(self, key: str, model: str):
+        self.key = key
+        self.model = model
+        self.deltas: List[str] = []
+        self.result: Optional[GenerationResult] = None
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.waiters: List[WaitCallback] = []
+        self.cancel = CancelToken()
+        self.producer: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None or self.error is not None
+
+    def on_wait(self, position: int, eta: float):
+        for waiter in list(self.waiters):
+            waiter(position, eta)
+
+
+class SingleFlight:
+    """Coalesce identical in-flight generations.
+
+    The first request for a key starts the upstream stream on a producer
+    thread; every request for the same key while it runs subscribes to it
+    and gets the full token stream, replaying from the first token if it
+    joined late. Queue updates fan out too. A subscriber that stops only
+    leaves; upstream is cancelled once nobody is listening.
+    """
+
+    def __init__(self):
+        self.stats = Counter()
+        self._flights: Dict[str, Flight] = {}
+        self._cond = threading.Condition()
+        self._aflights: Dict[str, Flight] = {}
+        self._aupdated: Dict[str, asyncio.Event] = {}
+
+    # ---------- THREADS ----------
+    def generate(
+        self,
+        key: str,
+        model: str,
+        open_stream: OpenStream,
+        on_wait: Optional[WaitCallback] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Generator[str, None, GenerationResult]:
+        """Same protocol as ``OllamaClient.generate``; ``open_stream(cancel, on_wait)``
+        is only called for the first request of a flight"""
+        with self._cond:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight(key, model)
+                threading.Thread(
+                    target=self._produce, args=(flight, open_stream), name="single-flight", daemon=True,
+                ).start()
+                self.stats["leaders"] += 1
+            else:
+                self.stats["followers"] += 1
+                metrics.inc("coalesced_requests_total")
+            flight.subscribers += 1
+            if on_wait:
+                flight.waiters.append(on_wait)
+        return self._follow(flight, on_wait, cancel)
+
+    def _produce(self, flight: Flight, open_stream: OpenStream):
+        stream = open_stream(flight.cancel, flight.on_wait)
+        try:
+            while True:
+                try:
+                    delta = next(stream)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+                with self._cond:
+                    flight.deltas.append(delta)
+                    self._cond.notify_all()
+        except BaseException as e:
+            with self._cond:
+                flight.error = e
+        else:
+            with self._cond:
+                flight.result = result
+        finally:
+            stream.close()
+            with self._cond:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+                self._cond.notify_all()
+
+    def _follow(
+        self, flight: Flight, on_wait: Optional[WaitCallback], cancel: Optional[CancelToken]
+    ) -> Generator[str, None, GenerationResult]:
+        sent = 0
+        try:
+            while True:
+                with self._cond:
+                    while sent == len(flight.deltas) and not flight.done:
+                        if cancel and cancel.cancelled:
+                            break
+                        self._cond.wait(0.25)
+                    pending = flight.deltas[sent:]
+                    finished = flight.done and sent + len(pending) == len(flight.deltas)
+                if cancel and cancel.cancelled:
+                    return GenerationResult("".join(flight.deltas[:sent]), flight.model, "cancelled")
+                for delta in pending:
+                    sent += 1
+                    yield delta
+                if finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return flight.result
+        finally:
+            self._leave(flight, on_wait)
+
+    def _leave(self, flight: Flight, on_wait: Optional[WaitCallback]):
+        with self._cond:
+            flight.subscribers -= 1
+            if on_wait in flight.waiters:
+                flight.waiters.remove(on_wait)
+            last = flight.subscribers == 0 and not flight.done
+            if last and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if last:
+            flight.cancel.cancel("no subscribers")
+
+    # ---------- ASYNCIO ----------
+    async def agenerate(
+        self,
+        key: str,
+        model: str,
+        open_stream: OpenAsyncStream,
+        on_wait: Optional[WaitCallback] = None,
+    ) -> AsyncGenerator[Union[str, GenerationResult], None]:
+        """``generate`` for the event loop, in the ``AsyncOllamaClient`` protocol.
+        The producer is a task; cancelling every subscriber cancels it."""
+        flight = self._aflights.get(key)
+        if flight is None:
+            flight = self._aflights[key] = Flight(key, model)
+            self._aupdated[key] = asyncio.Event()
+            flight.producer = asyncio.create_task(self._aproduce(flight, open_stream))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["followers"] += 1
+            metrics.inc("coalesced_requests_total")
+        flight.subscribers += 1
+        if on_wait:
+            flight.waiters.append(on_wait)
+        updated = self._aupdated[key]
+
+        sent = 0
+        try:
+            while True:
+                while sent < len(flight.deltas):
+                    sent += 1
+                    yield flight.deltas[sent - 1]
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    yield flight.result
+                    return
+                updated.clear()
+                await updated.wait()
+        finally:
+            flight.subscribers -= 1
+            if on_wait in flight.waiters:
+                flight.waiters.remove(on_wait)
+            if flight.subscribers == 0 and not flight.done:
+                flight.producer.cancel()
+                self._forget(flight)
+
+    async def _aproduce(self, flight: Flight, open_stream: OpenAsyncStream):
+        updated = self._aupdated[flight.key]
+        try:
+            async for item in open_stream(flight.on_wait):
+                if isinstance(item, GenerationResult):
+                    flight.result = item
+                else:
+                    flight.deltas.append(item)
+                updated.set()
+            if flight.result is None:
+                flight.result = GenerationResult("".join(flight.deltas), flight.model, None)
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            updated.set()
+            self._forget(flight)
+
+    def _forget(self, flight: Flight):
+        if self._aflights.get(flight.key) is flight:
+            del self._aflights[flight.key]
+            del self._aupdated[flight.key]
+
+
+# Global coalescing layer shared by every session
+single_flight = SingleFlight()
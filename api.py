@@ -0,0 +1,355 @@
+"""Headless SmartBank chat API, an ASGI app on the same engine as the UI.
+
+    uvicorn api:app --port 8600          # or: python api.py --port 8600
+
+Endpoints:
+
+    POST /v1/chat                         {"owner_id", "message", "conversation_id"?, "model"?}
+         -> text/event-stream of ``meta``, ``queue``, ``delta``, ``done`` / ``error`` events
+    GET  /v1/conversations?owner_id=...   newest conversation headers
+    GET  /v1/conversations/{id}/messages?owner_id=...&before=&limit=
+    GET  /healthz                         aggregated Ollama backend health
+    GET  /metrics                         Prometheus text format
+
+Authentication: with ``SMARTBANK_API_KEYS="key1=owner1,key2=owner2"`` every
+conversation endpoint needs ``Authorization: Bearer <key>`` and acts for
+that key's owner; an ``owner_id`` in the request must match it or may be
+left out. Without keys ``owner_id`` is taken on trust and anyone who can
+reach the API can read anyone's conversations, so only run it that way
+behind a gateway that authenticates users and sets ``owner_id`` itself.
+
+Every turn runs as a coroutine on one event loop and streams from Ollama
+through ``AsyncOllamaClient``, so a process holds many concurrent
+conversations without a thread each. A client that disconnects cancels
+its turn, which closes the Ollama stream; the partial reply is saved like
+a Stop in the UI. With ``SMARTBANK_SPECULATIVE=1`` generation starts on
+the engine's thread-side flight while the turn's checks run and is relayed
+to the loop once they pass (see ``ChatEngine``).
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from ai.engine import ChatEngine, Conversation, Turn, engine
+from ai.metrics import metrics
+from ai.ollama_client import GenerationResult
+
+Event = Optional[Tuple[str, Dict]]
+DEFAULT_MODEL = os.environ.get("SMARTBANK_MODEL", "llama3.2")
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ChatAPI:
+    """ASGI application. Open conversations (and their rolling summaries)
+    stay in memory, least recently used first out, up to ``max_open``."""
+
+    def __init__(self, chat_engine: ChatEngine, max_open: int = 1024, api_keys: Optional[Dict[str, str]] = None):
+        self.engine = chat_engine
+        self.max_open = max_open
+        self.api_keys = api_keys      # API key -> owner; None trusts the request's owner_id
+        self._open: "OrderedDict[int, Conversation]" = OrderedDict()
+        self._active: Dict[int, asyncio.Task] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"].rstrip("/")
+        query = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+        try:
+            if method == "POST" and path == "/v1/chat":
+                body = await _read_json(receive)
+                await self.chat(self._owner(scope, body), body, receive, send)
+            elif method == "GET" and path == "/v1/conversations":
+                headers = await asyncio.to_thread(
+                    self.engine.store.list_conversations, self._owner(scope, query),
+                    int(query.get("limit", 20)), int(query.get("offset", 0)),
+                )
+                await _send_json(send, 200, {"conversations": [h._asdict() for h in headers]})
+            elif method == "GET" and path.startswith("/v1/conversations/") and path.endswith("/messages"):
+                await self.messages(int(path.split("/")[3]), self._owner(scope, query), query, send)
+            elif method == "GET" and path == "/healthz":
+                health = self.engine.pool.health(wait=0)
+                await _send_json(send, 200 if health.running else 503, health._asdict())
+            elif method == "GET" and path == "/metrics":
+                await _send(send, 200, b"text/plain; version=0.0.4", metrics.render_prometheus().encode())
+            else:
+                raise HTTPError(404, "not found")
+        except HTTPError as e:
+            await _send_json(send, e.status, {"error": str(e)})
+        except ValueError as e:
+            await _send_json(send, 400, {"error": str(e)})
+
+    def _owner(self, scope, params: Dict) -> str:
+        """The owner this request acts for"""
+        if self.api_keys is None:
+            return _required(params, "owner_id")
+        key = _bearer_token(scope)
+        owner = next((o for k, o in self.api_keys.items() if key and hmac.compare_digest(k, key)), None)
+        if owner is None:
+            raise HTTPError(401, "missing or unknown API key")
+        if params.get("owner_id") not in (None, owner):
+            raise HTTPError(403, "owner_id does not belong to this API key")
+        return owner
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.engine.pool.preload(DEFAULT_MODEL)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.to_thread(self.engine.store.flush)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # ---------- CONVERSATIONS ----------
+    async def _conversation(self, owner_id: str, conversation_id: Optional[int]) -> Conversation:
+        if conversation_id is None:
+            return Conversation(owner_id)
+        conversation = self._open.get(conversation_id)
+        if conversation is None:
+            conversation = await asyncio.to_thread(self.engine.open_conversation, owner_id, conversation_id)
+            if conversation is None:
+                raise HTTPError(404, "conversation not found")
+            self._remember(conversation)
+        elif conversation.owner_id != owner_id:
+            raise HTTPError(404, "conversation not found")
+        self._open.move_to_end(conversation_id)
+        return conversation
+
+    def _remember(self, conversation: Conversation):
+        self._open[conversation.conversation_id] = conversation
+        while len(self._open) > self.max_open:
+            oldest, _ = self._open.popitem(last=False)
+            self._active.pop(oldest, None)
+
+    async def messages(self, conversation_id: int, owner_id: str, query: Dict[str, str], send):
+        owner = await asyncio.to_thread(self.engine.store.owner_of, conversation_id)
+        if owner is None or owner != owner_id:
+            raise HTTPError(404, "conversation not found")
+        before = int(query["before"]) if "before" in query else None
+        page = await asyncio.to_thread(
+            self.engine.store.load_messages, conversation_id, before, int(query.get("limit", 30))
+        )
+        await _send_json(send, 200, {
+            "messages": [
+                {"role": m.role, "content": m.content, "time": m.time.isoformat()} for m in page.messages
+            ],
+            "first_seq": page.first_seq,
+        })
+
+    # ---------- CHAT ----------
+    async def chat(self, owner_id: str, body: Dict, receive, send):
+        prompt = _required(body, "message").strip()
+        if not prompt:
+            raise ValueError("message is empty")
+        conversation = await self._conversation(owner_id, body.get("conversation_id"))
+
+        # A turn still in flight for this conversation is superseded by this one
+        if previous := self._active.get(conversation.conversation_id):
+            previous.cancel()
+            await asyncio.gather(previous, return_exceptions=True)
+
+        events: "asyncio.Queue[Event]" = asyncio.Queue()
+        turn_task = asyncio.create_task(
+            self._run_turn(conversation, prompt, body.get("model") or DEFAULT_MODEL, events)
+        )
+        if conversation.conversation_id is not None:
+            self._active[conversation.conversation_id] = turn_task
+        watcher = asyncio.create_task(_watch_disconnect(receive, turn_task))
+
+        await send({
+            "type": "http.response.start", "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+        })
+        try:
+            while (event := await events.get()) is not None:
+                name, data = event
+                chunk = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        except OSError:
+            turn_task.cancel()
+        finally:
+            watcher.cancel()
+            await asyncio.gather(turn_task, return_exceptions=True)
+            if self._active.get(conversation.conversation_id) is turn_task:
+                del self._active[conversation.conversation_id]
+
+    async def _run_turn(self, conversation: Conversation, prompt: str, model: str, events: "asyncio.Queue[Event]"):
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        path = "error"
+
+        def on_wait(position: int, eta: float):
+            # Called from the scheduler's waiting thread
+            loop.call_soon_threadsafe(events.put_nowait, ("queue", {"position": position, "eta_s": round(eta, 1)}))
+
+        try:
+            new = conversation.conversation_id is None
+            begin = _Begin(self.engine.begin_turn)
+            try:
+                turn = await asyncio.to_thread(begin, conversation, prompt, model)
+            except asyncio.CancelledError:
+                begin.orphan()
+                raise
+            path = turn.path
+            if new:
+                self._remember(conversation)
+                self._active[conversation.conversation_id] = asyncio.current_task()
+            events.put_nowait(("meta", {"conversation_id": conversation.conversation_id, "path": turn.path}))
+            if turn.reply is not None:
+                events.put_nowait(("done", {"content": turn.reply, "done_reason": turn.path}))
+                return
+
+            parts = []
+            result = GenerationResult("", model, None)
+            try:
+                async for item in self.engine.astream(turn, conversation.owner_id, on_wait):
+                    if isinstance(item, GenerationResult):
+                        result = item
+                    else:
+                        parts.append(item)
+                        events.put_nowait(("delta", {"text": item}))
+            except asyncio.CancelledError:
+                self.engine.interrupt_turn(conversation, "".join(parts))
+                path = "cancelled"
+                raise
+            content = await asyncio.to_thread(self.engine.finish_turn, conversation, turn, result)
+            events.put_nowait(("done", {
+                "content": content,
+                "done_reason": result.done_reason,
+                "eval_count": result.eval_count,
+                "prompt_eval_count": result.prompt_eval_count,
+            }))
+        except Exception as e:
+            path = "error"
+            events.put_nowait(("error", {"message": self.engine.fail_turn(conversation, e)}))
+        finally:
+            metrics.observe("turn_seconds", time.perf_counter() - started, path=path)
+            events.put_nowait(None)
+
+
+class _Begin:
+    """``begin_turn`` on a worker thread, which carries on when the awaiting
+    task is cancelled. Whichever of the two finishes second abandons the
+    speculative generation, so nothing keeps generating for a turn nobody
+    will stream."""
+
+    def __init__(self, begin_turn: Callable[..., Turn]):
+        self.begin_turn = begin_turn
+        self.turn: Optional[Turn] = None
+        self.orphaned = False
+        self._lock = threading.Lock()
+
+    def __call__(self, *args) -> Turn:
+        turn = self.begin_turn(*args)
+        with self._lock:
+            self.turn = turn
+            orphaned = self.orphaned
+        if orphaned:
+            _abandon(turn)
+        return turn
+
+    def orphan(self):
+        with self._lock:
+            self.orphaned = True
+            turn = self.turn
+        if turn is not None:
+            _abandon(turn)
+
+
+def _abandon(turn: Turn):
+    if turn.speculation is not None:
+        turn.speculation.abandon("cancelled")
+
+
+async def _watch_disconnect(receive, task: asyncio.Task):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    task.cancel()
+
+
+async def _read_json(receive) -> Dict:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        data = json.loads(body or b"{}")
+    except json.JSONDecodeError:
+        raise ValueError("body is not valid JSON")
+    if not isinstance(data, dict):
+        raise ValueError("body must be a JSON object")
+    return data
+
+
+def _bearer_token(scope) -> Optional[str]:
+    for name, value in scope.get("headers", []):
+        if name.lower() == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" else None
+    return None
+
+
+def _api_keys_from_env() -> Optional[Dict[str, str]]:
+    spec = os.environ.get("SMARTBANK_API_KEYS", "").strip()
+    if not spec:
+        return None
+    pairs = (item.partition("=") for item in spec.split(",") if item.strip())
+    return {key.strip(): owner.strip() for key, _, owner in pairs if key.strip() and owner.strip()}
+
+
+def _required(data: Dict, key: str):
+    if not data.get(key):
+        raise ValueError(f"{key} is required")
+    return data[key]
+
+
+async def _send(send, status: int, content_type: bytes, body: bytes):
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", content_type)]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status: int, data: Dict):
+    await _send(send, status, b"application/json", json.dumps(data, default=str).encode("utf-8"))
+
+
+app = ChatAPI(engine, api_keys=_api_keys_from_env())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The API needs an ASGI server: pip install uvicorn")
+    if app.api_keys is None:
+        print("SMARTBANK_API_KEYS is not set: owner_id is trusted, so keep this API behind "
+              "an authenticating gateway", file=sys.stderr)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
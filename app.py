@@ -1,32 +1,49 @@
+import time
+_run_started = time.perf_counter()
+import os
 import streamlit as st
-from datetime import datetime
+import uuid
 st.set_page_config(
     page_title="SmartBank Chatbot",
     page_icon="🏦",
     layout="wide",
     initial_sidebar_state="expanded",
 )
-from components.sidebar import render_sidebar
-from components.chat_ui import render_chat_ui
-# Load CSS AFTER set_page_config
-with open("styles.css") as f:
-    st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+from components.assets import FOOTER_HTML, styles_html
+# Load CSS AFTER set_page_config (read once per process)
+st.markdown(styles_html(), unsafe_allow_html=True)
 # ---------- SESSION STATE ----------
 if "messages" not in st.session_state:
     st.session_state.messages = []
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "current_chat_id" not in st.session_state:
-    st.session_state.current_chat_id = 0
+if "conversation_id" not in st.session_state:
+    st.session_state.conversation_id = None   # created on the first message
+if "first_seq" not in st.session_state:
+    st.session_state.first_seq = 0            # > 0 when earlier messages are not loaded
+if "owner_id" not in st.session_state:
+    # The owner id is the only thing between a visitor and stored banking
+    # chats, so it lives in the session and dies with it. With
+    # SMARTBANK_URL_IDENTITY=1 it is kept in the URL (?uid=) so history
+    # survives reloads; anyone holding that URL then reads the history,
+    # so only use it for single-user or demo deployments.
+    url_identity = os.environ.get("SMARTBANK_URL_IDENTITY") == "1"
+    st.session_state.owner_id = (url_identity and st.query_params.get("uid")) or uuid.uuid4().hex
+    if url_identity:
+        st.query_params["uid"] = st.session_state.owner_id
 if "ollama_model" not in st.session_state:
     st.session_state.ollama_model = "llama3.2"
 # ---------- RENDER LAYOUT ----------
+# Header first: it paints before the Ollama/storage stack is imported
+from components.chat_ui import render_chat_header, render_chat_ui
+render_chat_header()
+from components.sidebar import render_sidebar
+from components.resources import warm_up
+from ai.metrics import metrics, start_exporters_from_env
+start_exporters_from_env()
+warm_up()
 with st.sidebar:
     render_sidebar()
-render_chat_ui()
+turn_path = render_chat_ui()
 # Footer
-st.markdown("""
-<div style='text-align:center;padding:20px;color:#a5b4fc;font-size:12px;'>
-    🤖 Modular SmartBank AI | Ollama + Llama3
-</div>
-""", unsafe_allow_html=True)
+st.markdown(FOOTER_HTML, unsafe_allow_html=True)
+# Rerun overhead is the runs without a turn; a turn's own time is turn_seconds
+metrics.observe("script_run_seconds", time.perf_counter() - _run_started, turn=turn_path or "none")
@@ -0,0 +1,219 @@
+"""Headless load benchmark for the chat pipeline against a mock Ollama.
+
+    python -m benchmarks.chat_bench --users 20 --turns 5 --out bench_results.json
+
+Starts ``benchmarks.mock_ollama`` in a subprocess (so its CPU time is not
+charged to the client), then drives N concurrent simulated users through
+intent routing, the guard, context building and streaming generation via
+the backend pool and scheduler. Reports TTFT and end-to-end latency
+percentiles, token throughput, memory per session and client CPU per
+token, and writes them as JSON for comparison between versions. Pass
+``--host`` to benchmark an already running (mock or real) server instead.
+"""
+import argparse
+import gc
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ai.context import ContextManager, RollingSummary
+from ai.guard import is_banking_question
+from ai.ollama_client import OllamaClient
+from ai.pool import BackendPool
+from ai.prompts import SYSTEM_PROMPT
+from ai.router import router
+from storage.messages import Message
+
+CORPUS = Path(__file__).parent / "data" / "guard_corpus.jsonl"
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": round(pick(0.50), 4), "p95": round(pick(0.95), 4),
+            "p99": round(pick(0.99), 4), "max": round(ordered[-1], 4)}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock(args) -> "tuple[subprocess.Popen, str]":
+    port = _free_port()
+    proc = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.mock_ollama", "--port", str(port),
+        "--ttft", str(args.ttft), "--tps", str(args.tps), "--jitter", str(args.jitter),
+        "--max-tokens", str(args.max_tokens), "--parallel", str(args.parallel),
+        "--failure-rate", str(args.failure_rate), "--drop-rate", str(args.drop_rate),
+        "--load-time", str(args.load_time),
+    ], stdout=subprocess.DEVNULL)
+    host = f"http://127.0.0.1:{port}"
+    client = OllamaClient(host)
+    for _ in range(100):
+        if client.refresh_health(wait=1.0).running:
+            return proc, host
+        time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("mock Ollama server did not start")
+
+
+class SimulatedUser:
+    def __init__(self, user_id: int, prompts: List[str], turns: int, think_time: float, seed: int):
+        self.session_id = f"bench-{user_id}"
+        self.messages: List[Message] = []
+        self.summary = RollingSummary()
+        self.prompts = prompts
+        self.turns = turns
+        self.think_time = think_time
+        self.rng = random.Random(seed)
+        self.records: List[Dict] = []
+
+    def run(self, pool: BackendPool, context: ContextManager, model: str):
+        for _ in range(self.turns):
+            self.records.append(self.turn(self.rng.choice(self.prompts), pool, context, model))
+            if self.think_time:
+                time.sleep(self.rng.uniform(0, 2 * self.think_time))
+
+    def turn(self, prompt: str, pool: BackendPool, context: ContextManager, model: str) -> Dict:
+        started = time.perf_counter()
+        self.messages.append(Message("user", prompt))
+        if routed := router.route(prompt):
+            self.messages.append(Message("assistant", routed.response))
+            return {"path": "router", "e2e": time.perf_counter() - started}
+        if not is_banking_question(prompt):
+            self.messages.append(Message("assistant", "refused"))
+            return {"path": "refused", "e2e": time.perf_counter() - started}
+
+        messages_for_ai = context.build(SYSTEM_PROMPT, self.messages, self.summary, model)
+        ttft: Optional[float] = None
+        tokens = 0
+        stream = pool.generate(messages_for_ai, model, session_id=self.session_id)
+        try:
+            while True:
+                next(stream)
+                tokens += 1
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+        except StopIteration as stop:
+            result = stop.value
+        except Exception as e:
+            self.messages.pop()
+            return {"path": "error", "error": type(e).__name__, "e2e": time.perf_counter() - started}
+        self.messages.append(Message("assistant", result.content))
+        return {
+            "path": "llm",
+            "ttft": ttft,
+            "e2e": time.perf_counter() - started,
+            "tokens": result.eval_count or tokens,
+        }
+
+
+def run(args) -> Dict:
+    proc = None
+    host = args.host
+    if not host:
+        proc, host = start_mock(args)
+    try:
+        prompts = [json.loads(line)["text"] for line in CORPUS.read_text(encoding="utf-8").splitlines() if line.strip()]
+        pool = BackendPool([OllamaClient(h) for h in host.split(",")])
+        for backend in pool.backends:
+            backend.scheduler.max_concurrent = args.slots
+            backend.scheduler.max_queue = max(args.users * 2, 32)
+        context = ContextManager(pool)
+        if args.preload:
+            for backend in pool.backends:
+                backend.client.preload(args.model).wait(args.load_time + 30)
+
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        users = [SimulatedUser(i, prompts, args.turns, args.think_time, seed=i) for i in range(args.users)]
+        threads = [threading.Thread(target=u.run, args=(pool, context, args.model)) for u in users]
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+        gc.collect()
+        session_bytes = (tracemalloc.get_traced_memory()[0] - baseline) / max(1, args.users)
+        tracemalloc.stop()
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=5)
+
+    records = [r for u in users for r in u.records]
+    llm = [r for r in records if r["path"] == "llm"]
+    tokens = sum(r["tokens"] for r in llm)
+    paths: Dict[str, int] = {}
+    for r in records:
+        paths[r["path"]] = paths.get(r["path"], 0) + 1
+    return {
+        "turns": len(records),
+        "paths": paths,
+        "wall_seconds": round(wall, 3),
+        "turns_per_second": round(len(records) / wall, 2),
+        "tokens_per_second": round(tokens / wall, 2),
+        "ttft_seconds": percentiles([r["ttft"] for r in llm if r["ttft"] is not None]),
+        "e2e_seconds_llm": percentiles([r["e2e"] for r in llm]),
+        "e2e_seconds_fast_path": percentiles([r["e2e"] for r in records if r["path"] in ("router", "refused")]),
+        "memory_per_session_bytes": int(session_bytes),
+        "client_cpu_ms_per_token": round(cpu * 1000 / tokens, 4) if tokens else None,
+        "backends": {b.host: b.scheduler.snapshot() for b in pool.backends},
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between turns (s)")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--host", help="benchmark these comma-separated hosts instead of a local mock")
+    parser.add_argument("--slots", type=int, default=4, help="client-side concurrent generations per backend")
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tps", type=float, default=40.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--max-tokens", type=int, default=80)
+    parser.add_argument("--parallel", type=int, default=4, help="mock server decode slots")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--load-time", type=float, default=0.0, help="mock cold model load (s)")
+    parser.add_argument("--preload", action="store_true", help="warm the model before the first turn")
+    parser.add_argument("--out", type=Path, default=Path("bench_results.json"))
+    args = parser.parse_args()
+
+    results = run(args)
+    report = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "results": results,
+    }
+    args.out.write_text(json.dumps(report, indent=2))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
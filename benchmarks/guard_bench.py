@@ -0,0 +1,96 @@
+"""Compare the compiled banking guard with the original substring scan.
+
+    python -m benchmarks.guard_bench [--corpus PATH] [--repeat N] [--scale N]
+
+Reports accuracy/precision/recall on the labelled corpus and ns/query for
+both implementations. ``--scale`` pads both keyword lists with N synthetic
+terms to show how each one behaves as the vocabulary grows.
+"""
+import argparse
+import json
+import random
+import string
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from ai import guard
+
+CORPUS = Path(__file__).parent / "data" / "guard_corpus.jsonl"
+
+LEGACY_KEYWORDS = [
+    "account", "balance", "loan", "emi", "interest", "card", "credit",
+    "debit", "statement", "transaction", "transfer", "upi", "imps",
+    "neft", "rtgs", "fd", "rd", "net banking", "netbanking",
+    "cheque", "branch", "ifsc", "limit", "otp", "pin", "security"
+]
+
+
+def legacy_guard(keywords: List[str]) -> Callable[[str], bool]:
+    def is_banking_question(text: str) -> bool:
+        text_lower = text.lower()
+        return any(word in text_lower for word in keywords)
+    return is_banking_question
+
+
+def compiled_guard(extra: List[str], scored: bool = False) -> Callable[[str], bool]:
+    if not extra:
+        return lambda text: guard.is_banking_question(text, scored=scored)
+    # Same shape as the unscored guard: any strong term outside its negative context
+    terms = {**guard.BANK_TERMS, **{t: 1.0 for t in extra}}
+    pattern, canonical = guard._compile(terms, guard.VARIANTS)
+    return lambda text: any(terms[t] >= guard.STRONG for t in guard._terms_in(text, pattern, canonical))
+
+
+def evaluate(fn: Callable[[str], bool], corpus: List[Dict], repeat: int) -> Dict:
+    tp = fp = fn_ = tn = 0
+    for item in corpus:
+        predicted = fn(item["text"])
+        if predicted and item["banking"]:
+            tp += 1
+        elif predicted:
+            fp += 1
+        elif item["banking"]:
+            fn_ += 1
+        else:
+            tn += 1
+
+    texts = [item["text"] for item in corpus]
+    start = time.perf_counter_ns()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    elapsed = time.perf_counter_ns() - start
+
+    return {
+        "accuracy": round((tp + tn) / len(corpus), 4),
+        "precision": round(tp / (tp + fp), 4) if tp + fp else 0.0,
+        "recall": round(tp / (tp + fn_), 4) if tp + fn_ else 0.0,
+        "false_positives": fp,
+        "false_negatives": fn_,
+        "ns_per_query": round(elapsed / (repeat * len(texts))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--scale", type=int, default=0, help="synthetic keywords to add")
+    args = parser.parse_args()
+
+    corpus = [json.loads(line) for line in args.corpus.read_text(encoding="utf-8").splitlines() if line.strip()]
+    rng = random.Random(0)
+    extra = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(6, 12))) for _ in range(args.scale)]
+
+    results = {
+        "legacy": evaluate(legacy_guard(LEGACY_KEYWORDS + extra), corpus, args.repeat),
+        "compiled": evaluate(compiled_guard(extra), corpus, args.repeat),
+    }
+    if not extra:
+        results["compiled_scored"] = evaluate(compiled_guard(extra, scored=True), corpus, args.repeat)
+    print(json.dumps({"corpus_size": len(corpus), "extra_keywords": args.scale, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""A stand-in Ollama server for offline benchmarks.
+
+Speaks enough of the Ollama HTTP API for OllamaClient: ``/api/tags``,
+``/api/ps``, ``/api/embed`` and streaming NDJSON ``/api/chat``; a chat for a
+model it doesn't list gets Ollama's 404. Timing is synthetic and
+configurable:
+
+    python -m benchmarks.mock_ollama --port 11435 --ttft 0.4 --tps 25 --jitter 0.2
+
+Decoding is limited to ``--parallel`` concurrent requests (like
+OLLAMA_NUM_PARALLEL); extra requests wait for a slot, and a client that
+disconnects mid-stream frees its slot immediately. With ``--load-time``
+models start unloaded: the first request pays the load, models stay
+resident for the request's ``keep_alive``, and a request with no
+messages only loads the model, as in Ollama.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+WORDS = (
+    "Your savings account balance is available in net banking under Accounts. "
+    "NEFT transfers settle in half-hourly batches and UPI works 24x7. "
+    "For security, never share your OTP or UPI PIN with anyone, including bank staff."
+).split()
+
+
+class MockConfig:
+    def __init__(
+        self,
+        ttft: float = 0.3,
+        tokens_per_sec: float = 30.0,
+        jitter: float = 0.1,
+        max_tokens: int = 120,
+        failure_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        parallel: int = 4,
+        models: Optional[List[str]] = None,
+        seed: int = 0,
+        load_time: float = 0.0,
+    ):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.jitter = jitter
+        self.max_tokens = max_tokens
+        self.failure_rate = failure_rate     # HTTP 500 before streaming
+        self.drop_rate = drop_rate           # connection dropped mid-stream
+        self.parallel = parallel
+        self.models = models or ["llama3.2:latest", "llama3.2"]
+        self.load_time = load_time
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def jittered(self, value: float) -> float:
+        with self.rng_lock:
+            return max(0.0, value * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def roll(self, probability: float) -> bool:
+        with self.rng_lock:
+            return self.rng.random() < probability
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: MockConfig):
+        super().__init__(address, MockHandler)
+        self.config = config
+        self.slots = threading.BoundedSemaphore(config.parallel)
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        # model -> unload deadline; without a load time the default model is always resident
+        self.loaded: Dict[str, float] = {} if config.load_time else {config.models[0]: float("inf")}
+        self.load_lock = threading.Lock()
+
+    def ensure_loaded(self, model: str, keep_alive) -> float:
+        """Load ``model`` if it isn't resident; returns the load time paid"""
+        model = _tagged(model)
+        with self.load_lock:
+            now = time.monotonic()
+            paid = 0.0
+            if self.loaded.get(model, 0.0) <= now:
+                paid = self.config.load_time
+                time.sleep(paid)
+                self.count("loads")
+            self.loaded[model] = time.monotonic() + _seconds(keep_alive)
+            return paid
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str, amount: int = 1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def start(self) -> "MockOllamaServer":
+        threading.Thread(target=self.serve_forever, name="mock-ollama", daemon=True).start()
+        return self
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockOllamaServer
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status: int, body: Dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        models = self.server.config.models
+        if self.path == "/api/tags":
+            self._json(200, {"models": [{"name": m} for m in models]})
+        elif self.path == "/api/ps":
+            now = time.monotonic()
+            self._json(200, {"models": [{"name": m} for m, until in self.server.loaded.items() if until > now]})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path == "/api/chat":
+            self._chat(self._body())
+        elif self.path == "/api/embed":
+            body = self._body()
+            inputs = body.get("input") or []
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            vectors = [[((hash(t) >> i) & 0xFF) / 255.0 for i in range(0, 64, 2)] for t in inputs]
+            self._json(200, {"model": body.get("model"), "embeddings": vectors})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def _chat(self, body: Dict):
+        server, config = self.server, self.server.config
+        server.count("requests")
+        if config.roll(config.failure_rate):
+            server.count("failed")
+            self._json(500, {"error": "injected failure"})
+            return
+
+        model = body.get("model", "")
+        if _tagged(model) not in {_tagged(m) for m in config.models}:
+            self._json(404, {"error": f"model '{model}' not found, try pulling it first"})
+            return
+        load_seconds = server.ensure_loaded(model, body.get("keep_alive", "5m"))
+        if not body.get("messages"):
+            self._json(200, {"model": model, "done": True, "done_reason": "load",
+                             "load_duration": int(load_seconds * 1e9)})
+            return
+        limit = int((body.get("options") or {}).get("num_predict") or config.max_tokens)
+        n_tokens = min(limit, config.max_tokens)
+        queued_at = time.perf_counter()
+        with server.slots:
+            prompt_started = time.perf_counter()
+            time.sleep(config.jittered(config.ttft))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            decode_started = time.perf_counter()
+            drop_at = int(n_tokens / 2) if config.roll(config.drop_rate) else -1
+            try:
+                for i in range(n_tokens):
+                    if i == drop_at:
+                        server.count("dropped")
+                        self.close_connection = True
+                        self.connection.shutdown(2)
+                        return
+                    word = WORDS[i % len(WORDS)]
+                    self._chunk({"model": model, "message": {"role": "assistant", "content": word + " "}, "done": False})
+                    server.count("tokens")
+                    time.sleep(config.jittered(1.0 / config.tokens_per_sec))
+                now = time.perf_counter()
+                self._chunk({
+                    "model": model, "message": {"role": "assistant", "content": ""}, "done": True,
+                    "done_reason": "stop" if n_tokens < limit else "length",
+                    "total_duration": int((now - queued_at) * 1e9),
+                    "load_duration": int(load_seconds * 1e9),
+                    "prompt_eval_count": sum(len(m.get("content", "")) // 4 for m in body.get("messages", [])),
+                    "prompt_eval_duration": int((decode_started - prompt_started) * 1e9),
+                    "eval_count": n_tokens,
+                    "eval_duration": int((now - decode_started) * 1e9),
+                })
+                self.wfile.write(b"0\r\n\r\n")
+                server.count("completed")
+            except (BrokenPipeError, ConnectionResetError):
+                server.count("aborted")     # client went away; stop "decoding"
+                self.close_connection = True
+
+    def _chunk(self, data: Dict):
+        line = json.dumps(data).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+
+def _tagged(model: str) -> str:
+    return model if ":" in model else f"{model}:latest"
+
+
+def _seconds(keep_alive) -> float:
+    """Ollama keep_alive ("30m", "1h", "90s", 300, -1) in seconds"""
+    if isinstance(keep_alive, (int, float)):
+        value = float(keep_alive)
+    else:
+        units = {"s": 1, "m": 60, "h": 3600}
+        text = str(keep_alive).strip()
+        value = float(text[:-1]) * units[text[-1]] if text[-1:] in units else float(text)
+    return float("inf") if value < 0 else value
+
+
+def serve(config: MockConfig, host: str = "127.0.0.1", port: int = 0) -> MockOllamaServer:
+    """Start a mock server on a background thread (port 0 picks a free port)"""
+    return MockOllamaServer((host, port), config).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tps", type=float, default=30.0)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--max-tokens", type=int, default=120)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--load-time", type=float, default=0.0, help="cold model load (s); 0 = always loaded")
+    args = parser.parse_args()
+
+    config = MockConfig(args.ttft, args.tps, args.jitter, args.max_tokens,
+                        args.failure_rate, args.drop_rate, args.parallel, load_time=args.load_time)
+    server = MockOllamaServer((args.host, args.port), config)
+    print(f"Mock Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
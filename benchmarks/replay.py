@@ -0,0 +1,250 @@
+"""Replay a corpus of customer conversations through the chat pipeline.
+
+    python -m benchmarks.replay corpus.jsonl --out replay.jsonl --workers 8
+    python -m benchmarks.replay corpus.jsonl --out replay.jsonl --resume
+
+Each corpus line is one conversation, either ``{"id": ..., "turns": [...]}``
+(user messages in order), ``{"id": ..., "messages": [{"role", "content"}]}``
+(only user messages are replayed) or a single question ``{"text": ...,
+"banking": bool}`` as in ``data/guard_corpus.jsonl``. Conversations run on
+a bounded pool of workers through ``ChatEngine`` (router, guard, context,
+cache, generation) against ``--host`` or OLLAMA_HOSTS, with a throwaway
+conversation store. One JSONL record per turn is appended as each
+conversation finishes, so ``--resume`` skips whatever is already in
+``--out``. Prints aggregate throughput, refusal rate, latency percentiles
+and, when the corpus is labelled, guard accuracy.
+
+``--speculative`` starts generation alongside the router, guard and cache
+(see ``ChatEngine``); ``--guard-delay`` stands in for a slower classifier,
+so comparing ``ttft_s`` with and without it shows the overlap gain.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+from ai.cache import ResponseCache
+from ai.context import ContextManager
+from ai.engine import ChatEngine, Conversation
+from ai.guard import banking_score, is_banking_question
+from ai.ollama_client import GenerationResult, OllamaClient
+from ai.pool import BackendPool, backend_pool
+from ai.prompts import SYSTEM_PROMPT
+from benchmarks.chat_bench import percentiles
+from storage.conversations import ConversationStore
+
+
+def read_corpus(path: Path) -> Iterator[Dict]:
+    """Normalised conversations: ``{"id", "turns", "label"}``"""
+    with path.open(encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "turns" in item:
+                turns = list(item["turns"])
+            elif "messages" in item:
+                turns = [m["content"] for m in item["messages"] if m.get("role") == "user"]
+            else:
+                turns = [item["text"]]
+            yield {"id": str(item.get("id", number)), "turns": turns, "label": item.get("banking")}
+
+
+def completed_ids(out: Path) -> Set[str]:
+    """Conversation ids already in ``out``; a torn last line is cut off"""
+    if not out.exists():
+        return set()
+    data = out.read_bytes()
+    if data and not data.endswith(b"\n"):
+        data = data[:data.rfind(b"\n") + 1]
+        out.write_bytes(data)
+    done = set()
+    for line in data.decode("utf-8").splitlines():
+        try:
+            done.add(json.loads(line)["id"])
+        except (ValueError, KeyError):
+            pass
+    return done
+
+
+class Replayer:
+    def __init__(self, engine: ChatEngine, model: str, out, keep_replies: bool = True):
+        self.engine = engine
+        self.model = model
+        self.out = out
+        self.keep_replies = keep_replies
+        self._lock = threading.Lock()
+
+    def run_conversation(self, item: Dict) -> List[Dict]:
+        state = Conversation(f"replay-{item['id']}")
+        records = [self.run_turn(state, item, index, prompt) for index, prompt in enumerate(item["turns"])]
+        with self._lock:
+            for record in records:
+                self.out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.out.flush()
+        return records
+
+    def run_turn(self, state: Conversation, item: Dict, index: int, prompt: str) -> Dict:
+        record = {"id": item["id"], "turn": index, "prompt": prompt, "banking_score": round(banking_score(prompt), 2)}
+        if item["label"] is not None and index == 0:
+            record["label"] = item["label"]
+        started = time.perf_counter()
+        ttft: Optional[float] = None
+        try:
+            turn = self.engine.begin_turn(state, prompt, self.model)
+            record["path"] = turn.path
+            if turn.reply is not None:
+                result = GenerationResult(turn.reply, self.model, turn.path)
+            else:
+                stream = self.engine.stream(turn, state.owner_id)
+                try:
+                    while True:
+                        next(stream)
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                except StopIteration as stop:
+                    result = stop.value
+                self.engine.finish_turn(state, turn, result)
+        except Exception as e:
+            record.update(path="error", error=f"{type(e).__name__}: {e}")
+            try:
+                self.engine.fail_turn(state, e)
+            except Exception:
+                pass    # the store is what failed; the record already says why
+            result = None
+        record["latency_s"] = round(time.perf_counter() - started, 4)
+        if ttft is not None:
+            record["ttft_s"] = round(ttft, 4)
+        if result is not None:
+            record.update(
+                done_reason=result.done_reason,
+                prompt_tokens=result.prompt_eval_count,
+                eval_tokens=result.eval_count,
+            )
+            if self.keep_replies:
+                record["reply"] = result.content
+        return record
+
+
+def summarise(records: List[Dict], wall: float) -> Dict:
+    paths: Dict[str, int] = {}
+    for r in records:
+        paths[r["path"]] = paths.get(r["path"], 0) + 1
+    generated = [r for r in records if r["path"] in ("llm", "cache")]
+    tokens = sum(r.get("eval_tokens", 0) for r in generated)
+    summary = {
+        "turns": len(records),
+        "conversations": len({r["id"] for r in records}),
+        "paths": paths,
+        "wall_seconds": round(wall, 3),
+        "turns_per_second": round(len(records) / wall, 2) if wall else None,
+        "tokens_per_second": round(tokens / wall, 2) if wall else None,
+        "refusal_rate": round(paths.get("refused", 0) / len(records), 4) if records else 0.0,
+        "error_rate": round(paths.get("error", 0) / len(records), 4) if records else 0.0,
+        "latency_s": percentiles([r["latency_s"] for r in records]),
+        "latency_s_generated": percentiles([r["latency_s"] for r in generated]),
+        "ttft_s": percentiles([r["ttft_s"] for r in generated if "ttft_s" in r]),
+    }
+    labelled = [r for r in records if "label" in r and r["path"] != "error"]
+    if labelled:
+        # Routed intents are banking by construction
+        predicted = [(r["path"] != "refused", r["label"]) for r in labelled]
+        tp = sum(p and l for p, l in predicted)
+        fp = sum(p and not l for p, l in predicted)
+        fn = sum(l and not p for p, l in predicted)
+        summary["guard"] = {
+            "labelled": len(labelled),
+            "accuracy": round(sum(p == l for p, l in predicted) / len(labelled), 4),
+            "precision": round(tp / (tp + fp), 4) if tp + fp else None,
+            "recall": round(tp / (tp + fn), 4) if tp + fn else None,
+        }
+    return summary
+
+
+def build_engine(args, store: ConversationStore) -> ChatEngine:
+    pool = BackendPool([OllamaClient(h) for h in args.host.split(",")]) if args.host else backend_pool
+    system_prompt = args.system_prompt.read_text(encoding="utf-8") if args.system_prompt else SYSTEM_PROMPT
+    guard = partial(is_banking_question, scored=True, threshold=args.threshold) if args.scored else is_banking_question
+    if args.guard_delay:
+        guard = partial(_slow_guard, guard, args.guard_delay)
+    return ChatEngine(
+        pool=pool,
+        context=ContextManager(pool),
+        cache=ResponseCache() if args.cache else ResponseCache(ttl=0),
+        conversations=store,
+        system_prompt=system_prompt,
+        guard=guard,
+        speculative=args.speculative,
+    )
+
+
+def _slow_guard(guard, delay: float, prompt: str) -> bool:
+    time.sleep(delay)
+    return guard(prompt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path)
+    parser.add_argument("--out", type=Path, default=Path("replay.jsonl"))
+    parser.add_argument("--resume", action="store_true", help="skip conversations already in --out")
+    parser.add_argument("--workers", type=int, default=4, help="conversations replayed concurrently")
+    parser.add_argument("--limit", type=int, help="replay at most this many conversations")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--host", help="comma-separated Ollama hosts (default: OLLAMA_HOSTS)")
+    parser.add_argument("--system-prompt", type=Path, help="file replacing the built-in system prompt")
+    parser.add_argument("--scored", action="store_true", help="use the weighted guard")
+    parser.add_argument("--threshold", type=float, default=1.0, help="weighted guard threshold")
+    parser.add_argument("--guard-delay", type=float, default=0.0, help="extra seconds per guard check")
+    parser.add_argument("--speculative", action="store_true", help="generate while the checks run")
+    parser.add_argument("--cache", action="store_true", help="answer repeats from the response cache")
+    parser.add_argument("--no-replies", action="store_true", help="leave reply text out of --out")
+    parser.add_argument("--summary", type=Path, help="also write the aggregate report here")
+    args = parser.parse_args()
+
+    done = completed_ids(args.out) if args.resume else set()
+    if not args.resume and args.out.exists():
+        args.out.unlink()
+    items = [item for item in read_corpus(args.corpus) if item["id"] not in done]
+    if args.limit is not None:
+        items = items[:args.limit]
+    print(f"{len(items)} conversations to replay ({len(done)} already done)", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as scratch, args.out.open("a", encoding="utf-8") as out:
+        store = ConversationStore(os.path.join(scratch, "replay.db"))
+        replayer = Replayer(build_engine(args, store), args.model, out, keep_replies=not args.no_replies)
+        records: List[Dict] = []
+        started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="replay")
+        try:
+            futures = [executor.submit(replayer.run_conversation, item) for item in items]
+            for finished, future in enumerate(as_completed(futures), 1):
+                records.extend(future.result())
+                if finished % 50 == 0:
+                    print(f"{finished}/{len(items)} conversations", file=sys.stderr)
+        except KeyboardInterrupt:
+            print("Interrupted; rerun with --resume to continue", file=sys.stderr)
+            executor.shutdown(wait=True, cancel_futures=True)
+        else:
+            executor.shutdown()
+        wall = time.perf_counter() - started
+        store.flush()
+
+    report = {"run": summarise(records, wall)}
+    if done:
+        everything = [json.loads(line) for line in args.out.read_text(encoding="utf-8").splitlines() if line]
+        report["all"] = summarise(everything, 0.0)
+    if args.summary:
+        args.summary.write_text(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
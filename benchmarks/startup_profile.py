@@ -0,0 +1,171 @@
+"""Import-time and rerun-time profile of the Streamlit entry point.
+
+    python -m benchmarks.startup_profile [--reruns 20] [--messages 300] [--check]
+
+Imports: each stage of ``app.py``'s import path is timed in a fresh
+interpreter, in the order the app imports it. ``first_paint`` is what
+must load before the header is on screen, ``sidebar`` what the Ollama
+status needs, and ``deferred`` what ``warm_up`` loads in the background.
+The slowest modules come from ``-X importtime``.
+
+Reruns: ``app.py`` is run headless with Streamlit's ``AppTest`` against a
+mock Ollama server: one cold run, then ``--reruns`` reruns of an empty chat
+and of a chat with ``--messages`` messages, which should cost the same.
+
+The budgets below are the targets; ``--check`` exits 1 if one is missed.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+STAGES = [
+    ("first_paint", ["streamlit", "components.assets", "components.chat_ui"]),
+    ("sidebar", ["components.sidebar", "ai.pool", "storage.conversations"]),
+    ("deferred", ["ai.engine"]),
+]
+
+BUDGETS = {
+    "first_paint_import_s": 0.6,
+    "cold_run_s": 2.0,
+    "rerun_p50_s": 0.05,
+    "rerun_long_chat_p50_s": 0.05,
+}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    # Not shared with chat_bench: importing it would load the app's modules
+    # into this process before the cold run
+    ordered = sorted(values) or [0.0]
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": round(pick(0.50), 4), "p95": round(pick(0.95), 4), "max": round(ordered[-1], 4)}
+
+
+_STAGE_SCRIPT = """
+import json, sys, time
+stages = json.loads(sys.argv[1])
+timings = {}
+for name, modules in stages:
+    started = time.perf_counter()
+    for module in modules:
+        __import__(module)
+    timings[name] = time.perf_counter() - started
+print(json.dumps(timings))
+"""
+
+
+def profile_imports(top: int) -> Dict:
+    """Per-stage import time and the slowest modules, each from a cold interpreter"""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")]))}
+    stages = subprocess.run(
+        [sys.executable, "-c", _STAGE_SCRIPT, json.dumps(STAGES)],
+        capture_output=True, text=True, cwd=ROOT, env=env,
+    )
+    if stages.returncode:
+        return {"error": stages.stderr.strip().splitlines()[-1]}
+    timings = {name: round(seconds, 4) for name, seconds in json.loads(stages.stdout).items()}
+
+    modules = [m for _, names in STAGES for m in names]
+    traced = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {m}" for m in modules)],
+        capture_output=True, text=True, cwd=ROOT, env=env,
+    )
+    rows = []
+    for line in traced.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    rows.sort(key=lambda r: r["self_ms"], reverse=True)
+    return {"stages_s": timings, "slowest_modules": rows[:top]}
+
+
+def profile_reruns(reruns: int, messages: int, host: str) -> Dict:
+    """Cold run and rerun times of app.py under AppTest"""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return {"error": "streamlit is not installed"}
+    from storage.messages import Message
+
+    os.environ.setdefault("OLLAMA_HOSTS", host)
+    os.chdir(ROOT)
+    app = AppTest.from_file(str(ROOT / "app.py"), default_timeout=60)
+    started = time.perf_counter()
+    app.run()
+    cold = time.perf_counter() - started
+
+    def rerun_times() -> List[float]:
+        times = []
+        for _ in range(reruns):
+            started = time.perf_counter()
+            app.run()
+            times.append(time.perf_counter() - started)
+        return times
+
+    empty = rerun_times()
+    app.session_state["messages"] = [
+        Message("user" if i % 2 == 0 else "assistant", f"Message {i} about my savings account and UPI limits.")
+        for i in range(messages)
+    ]
+    long_chat = rerun_times()
+    return {
+        "cold_run_s": round(cold, 4),
+        "rerun_s": percentiles(empty),
+        f"rerun_{messages}_messages_s": percentiles(long_chat),
+        "exceptions": [str(e.value) for e in app.exception],
+    }
+
+
+def check_budgets(report: Dict, messages: int) -> Dict[str, Dict]:
+    imports, reruns = report["imports"], report["reruns"]
+    measured = {
+        "first_paint_import_s": imports.get("stages_s", {}).get("first_paint"),
+        "cold_run_s": reruns.get("cold_run_s"),
+        "rerun_p50_s": reruns.get("rerun_s", {}).get("p50"),
+        "rerun_long_chat_p50_s": reruns.get(f"rerun_{messages}_messages_s", {}).get("p50"),
+    }
+    return {
+        name: {"budget": budget, "measured": measured[name],
+               "ok": None if measured[name] is None else measured[name] <= budget}
+        for name, budget in BUDGETS.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=300, help="length of the long chat")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--host", help="Ollama host for the rerun phase (default: a local mock)")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a budget is missed")
+    parser.add_argument("--out", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    report = {"imports": profile_imports(args.top)}
+    server = None
+    if not args.host:
+        from benchmarks.mock_ollama import MockConfig, serve
+        server = serve(MockConfig())
+    try:
+        report["reruns"] = profile_reruns(args.reruns, args.messages, args.host or server.url)
+    finally:
+        if server:
+            server.shutdown()
+    report["budgets"] = check_budgets(report, args.messages)
+
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
+    if args.check and any(b["ok"] is False for b in report["budgets"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
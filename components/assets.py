@@ -0,0 +1,32 @@
+import streamlit as st
+from pathlib import Path
+
+STYLES_PATH = Path(__file__).resolve().parent.parent / "styles.css"
+
+WELCOME_HTML = """
+<div class="header-card">
+    <div style='font-size:12px;color:#a5b4fc;'>Powered by Ollama + Llama3</div>
+    <div style='font-size:28px;font-weight:700;color:white;'>Local AI Banking Chat</div>
+    <div style='font-size:14px;color:#a5b4fc;margin-top:12px;'>
+        💬 Ask about accounts, transfers, loans<br>
+        🤖 Runs 100% locally - no API costs!
+    </div>
+</div>
+"""
+
+SIDEBAR_TITLE_HTML = """
+<div class="smartbank-title">🏦 SmartBank AI</div>
+<div class="smartbank-subtitle">Llama3 Local AI</div>
+"""
+
+FOOTER_HTML = """
+<div style='text-align:center;padding:20px;color:#a5b4fc;font-size:12px;'>
+    🤖 Modular SmartBank AI | Ollama + Llama3
+</div>
+"""
+
+
+@st.cache_resource(show_spinner=False)
+def styles_html() -> str:
+    """styles.css in a <style> tag, read from disk once per process"""
+    return f"<style>{STYLES_PATH.read_text(encoding='utf-8')}</style>"
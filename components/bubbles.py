@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Optional
+
+from storage.messages import Message
+
+
+def bubble_html(role: str, content: str, time: Optional[datetime] = None, continued: bool = False) -> str:
+    """HTML for one chat bubble; ``continued`` bubbles carry no timestamp"""
+    css = "user-bubble" if role == "user" else "bot-bubble"
+    if continued:
+        return f"""
+    <div class="chat-bubble {css} bubble-continued">
+        <div style="font-size:15px;line-height:1.5;">{content}</div>
+    </div>
+    """
+    return f"""
+    <div class="chat-bubble {css}">
+        <div style="font-size:15px;line-height:1.5;">{content}</div>
+        <div style="font-size:11px;color:#a5b4fc;margin-top:6px;">
+            {(time or datetime.now()).strftime('%H:%M')}
+        </div>
+    </div>
+    """
+
+
+def message_html(message: Message) -> str:
+    """Bubble HTML for a stored message, built once and kept on the message"""
+    if message.html is None:
+        message.html = bubble_html(message.role, message.content, message.time)
+    return message.html
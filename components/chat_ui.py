@@ -1,147 +1,131 @@
 import streamlit as st
-from datetime import datetime
-from ai.ollama_client import ollama
+import time
+from typing import TYPE_CHECKING, Optional
+from ai.scheduler import Overloaded
+from ai.cancel import CancelToken
+from ai.metrics import metrics
+from components.assets import WELCOME_HTML
+from components.bubbles import bubble_html, message_html
+from components.resources import get_engine, get_store
+from components.streaming import StreamRenderer
 
+if TYPE_CHECKING:
+    from ai.engine import Turn
 
-BANK_KEYWORDS = [
-    "account", "balance", "loan", "emi", "interest", "card", "credit",
-    "debit", "statement", "transaction", "transfer", "upi", "imps",
-    "neft", "rtgs", "fd", "rd", "net banking", "netbanking",
-    "cheque", "branch", "ifsc", "limit", "otp", "pin", "security"
-]
+HISTORY_WINDOW = 40    # messages emitted per rerun
 
-def is_banking_question(text: str) -> bool:
-    text_lower = text.lower()
-    return any(word in text_lower for word in BANK_KEYWORDS)
 
-
-def render_chat_ui():
-    """Render complete chat interface"""   
-    # Header
+def render_chat_header():
+    """Title, model and welcome card; needs nothing beyond session state"""
     col1, col2 = st.columns([1, 3])
     with col1:
-        chat_title = "SmartBank Chat" if st.session_state.current_chat_id == 0 else f"Chat #{st.session_state.current_chat_id + 1}"
+        chat_title = "SmartBank Chat" if st.session_state.conversation_id is None else f"Chat #{st.session_state.conversation_id}"
         st.markdown(f"### 🏦 **{chat_title}**")
     with col2:
-        st.markdown(f"**Model:** {st.session_state.ollama_model}")
+        # The sidebar's selectbox may have changed the model for this run
+        st.markdown(f"**Model:** {st.session_state.get('model_select', st.session_state.ollama_model)}")
     st.markdown("---")
     # Welcome Card
     if not st.session_state.messages:
-        st.markdown("""
-        <div class="header-card">
-            <div style='font-size:12px;color:#a5b4fc;'>Powered by Ollama + Llama3</div>
-            <div style='font-size:28px;font-weight:700;color:white;'>Local AI Banking Chat</div>
-            <div style='font-size:14px;color:#a5b4fc;margin-top:12px;'>
-                💬 Ask about accounts, transfers, loans<br>
-                🤖 Runs 100% locally - no API costs!
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(WELCOME_HTML, unsafe_allow_html=True)
+
+def render_chat_ui() -> Optional[str]:
+    """Render the conversation and the chat input; returns the path of a turn run this time"""
     # Chat Messages
     chat_container = st.container(height=600)
     render_messages(chat_container)
     # Chat Input + AI
-    handle_chat_input(chat_container)
+    return handle_chat_input(chat_container)
+
 def render_messages(chat_container):
-    """Render all chat messages"""
+    """Render the latest window of the chat; older messages sit behind "load earlier"
+    so a rerun costs the same however long the chat is"""
+    messages = st.session_state.messages
+    window = st.session_state.get("history_window", HISTORY_WINDOW)
+    hidden = max(0, len(messages) - window)
     with chat_container:
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(f"""
-                <div class="chat-bubble {'user-bubble' if message['role']=='user' else 'bot-bubble'}">
-                    <div style="font-size:15px;line-height:1.5;">{message['content']}</div>
-                    <div style="font-size:11px;color:#a5b4fc;margin-top:6px;">
-                        {message['time'].strftime('%H:%M')}
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+        if (hidden or st.session_state.first_seq > 0) and st.button("⬆️ Load earlier messages", key="load_earlier"):
+            if hidden < HISTORY_WINDOW and st.session_state.first_seq > 0:
+                page = get_store().load_messages(st.session_state.conversation_id, st.session_state.first_seq, HISTORY_WINDOW)
+                st.session_state.messages = page.messages + messages
+                st.session_state.first_seq = page.first_seq
+                st.session_state.pop("context_summary", None)
+            st.session_state.history_window = window + HISTORY_WINDOW
+            st.rerun()
+        for message in messages[-window:]:
+            with st.chat_message(message.role):
+                st.markdown(message_html(message), unsafe_allow_html=True)
 
-def handle_chat_input(chat_container):
+def handle_chat_input(chat_container) -> Optional[str]:
     """Handle user input and generate AI response"""
     if prompt := st.chat_input("Ask about banking, balances, transfers..."):
-        # Add user message
-        st.session_state.messages.append({
-            "role": "user",
-            "content": prompt,
-            "time": datetime.now()
-        })
-        render_new_message(chat_container, "user", prompt)
+        started = time.perf_counter()
+        path = run_turn(chat_container, prompt)
+        metrics.observe("turn_seconds", time.perf_counter() - started, path=path)
+        return path
+    return None
+
+def run_turn(chat_container, prompt: str) -> str:
+    """Answer one user message; returns which path answered it"""
+    render_new_message(chat_container, "user", prompt)
+    model = st.session_state.get("ollama_model", "llama3.2")
+    turn = get_engine().begin_turn(st.session_state, prompt, model)
 
-        # Check if question is banking related
-        if not is_banking_question(prompt):
+    try:
+        if turn.path == "router":
+            render_new_message(chat_container, "assistant", turn.reply)
+        elif turn.path == "refused":
             with chat_container:
                 with st.chat_message("assistant"):
-                    msg = (
-                        "I am your SmartBank virtual officer and can help **only** with "
-                        "banking-related questions like balances, transfers, cards, loans, "
-                        "EMIs, and security issues."
-                    )
-                    st.markdown(msg)
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": msg,
-                "time": datetime.now()
-            })
-            return  # do NOT call the AI
-
-        # Generate AI response for valid banking questions
-        generate_ai_response(chat_container)
+                    st.markdown(turn.reply)  # do NOT call the AI
+        else:
+            generate_ai_response(chat_container, turn)
+    finally:
+        # A rerun can interrupt before the stream is read; then nobody would stop it
+        if turn.speculation:
+            turn.speculation.abandon("interrupted")
+    return turn.path
 
 def render_new_message(chat_container, role: str, content: str):
     """Render single new message"""
     with chat_container:
         with st.chat_message(role):
-            st.markdown(f"""
-            <div class="chat-bubble {'user-bubble' if role=='user' else 'bot-bubble'}">
-                <div style="font-size:15px;line-height:1.5;">{content}</div>
-                <div style="font-size:11px;color:#a5b4fc;margin-top:6px;">
-                    {datetime.now().strftime('%H:%M')}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(bubble_html(role, content), unsafe_allow_html=True)
 
-def generate_ai_response(chat_container):
+@metrics.timed("generate_ai_response")
+def generate_ai_response(chat_container, turn: "Turn"):
     """Generate streaming AI response"""
+    engine = get_engine()
+    # A turn still in flight for this session is superseded by this one
+    if previous := st.session_state.get("active_generation"):
+        previous.cancel("superseded")
+    cancel = st.session_state.active_generation = CancelToken()
+    saved = False
+
     with chat_container:
         with st.chat_message("assistant"):
-            message_placeholder = st.empty()
-            full_response = ""
-            
-            system_prompt = """You are SmartBank AI, a professional banking assistant for Indian customers.
-            Use ₹ symbol for Indian Rupees. Sample balances: Savings ₹3,45,200.
-            Services: balance, transfer, statement, cards, EMI, security.
-            Always respond as a bank officer."""
-            
-            messages_for_ai = [
-                {"role": "system", "content": system_prompt},
-                *[{"role": msg["role"], "content": msg["content"]} for msg in st.session_state.messages]
-            ]
-            
+            renderer = StreamRenderer()
+            stop_slot = st.empty()
+            # Any click reruns the script, which interrupts the stream below
+            stop_slot.button("⏹ Stop", key="stop_generation")
+
             try:
-                model = st.session_state.get("ollama_model", "llama3.2")
-                response_generator = ollama.generate(messages_for_ai, model)
-                
-                for chunk in response_generator:
-                    full_response += chunk
-                    message_placeholder.markdown(f"""
-                    <div class="chat-bubble bot-bubble">
-                        <div style="font-size:15px;line-height:1.5;">{full_response}</div>
-                        <div style="font-size:11px;color:#a5b4fc;margin-top:6px;">
-                            {datetime.now().strftime('%H:%M')}
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                
-                # Save final response
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": full_response, 
-                    "time": datetime.now()
-                })
-                
+                stream = engine.stream(turn, st.session_state.owner_id, renderer.on_wait, cancel)
+                result = renderer.feed(stream, cancel)
+                engine.finish_turn(st.session_state, turn, result)
+                saved = True
+                stop_slot.empty()
+
+            except Overloaded as e:
+                st.warning(engine.fail_turn(st.session_state, e))
+                saved = True
             except Exception as e:
-                error_msg = f"❌ AI Error: {str(e)}"
-                st.session_state.messages.append({
-                    "role": "assistant", "content": error_msg, "time": datetime.now()
-                })
-                st.error(error_msg)
+                st.error(engine.fail_turn(st.session_state, e))
+                saved = True
+            finally:
+                if not saved:
+                    # Interrupted by Stop, a new message, navigation or a closed tab
+                    cancel.cancel("interrupted")
+                    engine.interrupt_turn(st.session_state, renderer.text)
+                if st.session_state.get("active_generation") is cancel:
+                    st.session_state.active_generation = None
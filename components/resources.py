@@ -0,0 +1,55 @@
+"""Process-wide resources shared by every session.
+
+The generation stack (numpy, the knowledge base, the response cache...)
+is imported on first use rather than when the app module loads, so the
+first paint doesn't wait for it; ``warm_up`` starts that import in the
+background as soon as the page is on screen.
+"""
+import importlib
+import threading
+from typing import TYPE_CHECKING
+
+import streamlit as st
+
+if TYPE_CHECKING:
+    from ai.engine import ChatEngine
+    from ai.pool import BackendPool
+    from storage.conversations import ConversationStore
+
+WARM_MODULES = ("ai.engine",)
+
+_warm_lock = threading.Lock()
+_warm_started = False
+
+
+@st.cache_resource(show_spinner=False)
+def get_engine() -> "ChatEngine":
+    from ai.engine import engine
+    return engine
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool() -> "BackendPool":
+    from ai.pool import backend_pool
+    return backend_pool
+
+
+@st.cache_resource(show_spinner=False)
+def get_store() -> "ConversationStore":
+    from storage.conversations import store
+    return store
+
+
+def warm_up():
+    """Import the heavy modules on a background thread (once per process)"""
+    global _warm_started
+    with _warm_lock:
+        if _warm_started:
+            return
+        _warm_started = True
+
+    def load():
+        for name in WARM_MODULES:
+            importlib.import_module(name)
+
+    threading.Thread(target=load, name="warm-up", daemon=True).start()
@@ -1,28 +1,42 @@
 import streamlit as st
-from datetime import datetime
-from ai.ollama_client import ollama
+import os
+from contextlib import closing
+from ai.metrics import metrics
+from components.assets import SIDEBAR_TITLE_HTML
+from components.resources import get_engine, get_pool, get_store
 
 
 def render_sidebar():
     """Render complete sidebar with Ollama config + chat history"""
 
-    st.markdown("""
-    <div class="smartbank-title">🏦 SmartBank AI</div>
-    <div class="smartbank-subtitle">Llama3 Local AI</div>
-    """, unsafe_allow_html=True)
+    st.markdown(SIDEBAR_TITLE_HTML, unsafe_allow_html=True)
 
+    backend_pool = get_pool()
     # Ollama Config
     with st.expander("🤖 **Ollama Setup**", expanded=False):
         st.info("🚀 **Run first:**\n``````")
 
-        if ollama.is_running():
+        health = backend_pool.health()
+        if health.running:
             st.success("✅ Ollama **running**")
-            models = ollama.get_models()
+            if len(backend_pool.backends) > 1:
+                admitted = [b for b in backend_pool.backends if not b.ejected_until]
+                st.caption(f"🖧 {len(admitted)}/{len(backend_pool.backends)} backends in rotation")
+            models = list(health.models)
             if models:
                 model = st.selectbox("AI Model", models, key="model_select")
                 st.session_state.ollama_model = model
+                # Load the model before the first question (again after a switch)
+                if st.session_state.get("preloaded_model") != model:
+                    backend_pool.preload(model)
+                    st.session_state.preloaded_model = model
+                load_state = backend_pool.load_state(model)
+                st.caption({"loaded": "🔥 Model loaded", "loading": "⏳ Loading model...",
+                            "cold": "❄️ Model not loaded yet"}[load_state])
             else:
                 st.warning("No models found. Run: `ollama pull llama3.2`")
+        elif health.running is None:
+            st.info("⏳ Checking Ollama server...")
         else:
             st.error("❌ **Ollama not running!**\nStart: `ollama serve`")
             st.stop()
@@ -30,66 +44,144 @@ def render_sidebar():
         if st.button("🧪 Test AI", key="test_ollama"):
             with st.spinner("Testing..."):
                 try:
-                    for chunk in ollama.generate([{"role": "user", "content": "Say 'Ready!'"}]):
-                        st.success("✅ **Test OK**!")
-                        break
+                    test_stream = backend_pool.generate(
+                        [{"role": "user", "content": "Say 'Ready!'"}],
+                        st.session_state.ollama_model,
+                        options={"num_predict": 8},
+                    )
+                    # closing() drops the HTTP stream so Ollama stops decoding
+                    with closing(test_stream) as chunks:
+                        for chunk in chunks:
+                            st.success("✅ **Test OK**!")
+                            break
                 except Exception as e:
                     st.error(f"❌ Test failed: {str(e)}")
 
+    # 📊 Admin panel (?admin=1 or SMARTBANK_ADMIN=1)
+    if st.query_params.get("admin") == "1" or os.environ.get("SMARTBANK_ADMIN") == "1":
+        render_admin_panel()
+
     st.markdown("<hr style='border-color: rgba(75,85,99,0.6);'>", unsafe_allow_html=True)
 
     # Chat History
     render_chat_history()
 
 
+def render_admin_panel():
+    """Latency percentiles and queue/cache counters for this process"""
+    # Admin-only: keep these (numpy via the cache) off the first-paint path
+    from ai.cache import response_cache
+    from ai.prompts import SYSTEM_PROMPT_HASH
+    from ai.router import router
+    from ai.singleflight import single_flight
+    backend_pool = get_pool()
+    with st.expander("📊 **Performance**", expanded=False):
+        rows = [
+            {
+                "metric": row["metric"],
+                "n": row["count"],
+                "p50": _fmt(row["metric"], row["p50"]),
+                "p95": _fmt(row["metric"], row["p95"]),
+                "p99": _fmt(row["metric"], row["p99"]),
+            }
+            for row in metrics.summary()
+        ]
+        if rows:
+            st.table(rows)
+        else:
+            st.caption("No turns recorded yet")
+        for backend in backend_pool.backends:
+            st.caption(f"🖧 {backend.host}: {backend.scheduler.snapshot()}")
+        st.caption(f"🗂️ Cache hit rate {response_cache.hit_rate():.0%} · {dict(response_cache.stats)}")
+        st.caption(f"🧭 Router {dict(router.hits)}")
+        st.caption(f"🔗 Coalesced generations {dict(single_flight.stats)}")
+        if get_engine().speculative:
+            st.caption("⚡ Speculative generation: replies start while the checks run")
+        st.caption(f"🧩 System prompt {SYSTEM_PROMPT_HASH} · keep_alive {backend_pool.backends[0].client.keep_alive}")
+
+
+def _fmt(metric: str, value: float) -> str:
+    if metric.startswith("decode_tokens_per_second"):
+        return f"{value:.1f} tok/s"
+    return f"{value * 1000:.1f} ms" if value < 1 else f"{value:.2f} s"
+
+
 def render_chat_history():
     """Render chat history with delete buttons"""
     st.markdown("<div class='chat-history-label'>💬 Chat History</div>", unsafe_allow_html=True)
 
-    # ➕ New Chat button
+    # ➕ New Chat button (the open chat is already persisted)
     if st.button("➕ New Chat", key="new_chat", use_container_width=True):
-        if st.session_state.messages:
-            # Get first user question as preview (like ChatGPT / Perplexity)
-            first_user_msg = next(
-                (m["content"] for m in st.session_state.messages if m["role"] == "user"),
-                st.session_state.messages[0]["content"]
-            )
-            preview_text = first_user_msg.strip().split("\n")[0]  # first line only
-            preview_text = preview_text[:40] + ("..." if len(preview_text) > 40 else "")
-
-            st.session_state.chat_history.append({
-                "id": len(st.session_state.chat_history),
-                "title": f"Chat {len(st.session_state.chat_history) + 1}",
-                "preview": preview_text,
-                "messages": st.session_state.messages.copy()
-            })
-        st.session_state.messages = []
-        st.session_state.current_chat_id = -1
+        reset_chat()
         st.rerun()
 
-    # Existing chats
-    if st.session_state.chat_history:
-        last_chats = st.session_state.chat_history[-8:]
-        for idx, chat in enumerate(last_chats):
-            real_index = len(st.session_state.chat_history) - len(last_chats) + idx
+    # 🔎 Search across all stored chats (FTS index, no message rescans)
+    query = st.text_input("Search chats", key="history_search", placeholder="🔎 Search chats...",
+                          label_visibility="collapsed")
+    if query.strip():
+        render_search_results(query)
+        return
+
+    # Existing chats: headers only, messages are loaded when a chat is opened
+    store = get_store()
+    chats = store.list_conversations(st.session_state.owner_id, limit=8)
+    if chats:
+        for chat in chats:
             row_cols = st.columns([4, 1])
 
             # Open chat button with preview as label
             with row_cols[0]:
-                label_preview = chat.get("preview") or f"Chat {chat['id'] + 1}"
+                label_preview = chat.preview or chat.title
                 label = f"📄 {label_preview}"
-                if st.button(label, key=f"open_{chat['id']}", use_container_width=True):
-                    st.session_state.messages = chat["messages"].copy()
-                    st.session_state.current_chat_id = chat["id"]
+                if st.button(label, key=f"open_{chat.id}", use_container_width=True):
+                    page = store.load_messages(chat.id)
+                    st.session_state.messages = page.messages
+                    st.session_state.first_seq = page.first_seq
+                    st.session_state.pop("context_summary", None)
+                    st.session_state.pop("history_window", None)
+                    st.session_state.conversation_id = chat.id
                     st.rerun()
 
             # Delete chat button
             with row_cols[1]:
-                if st.button("🗑️", key=f"del_{chat['id']}", use_container_width=True):
-                    st.session_state.chat_history.pop(real_index)
-                    if st.session_state.current_chat_id == chat["id"]:
-                        st.session_state.messages = []
-                        st.session_state.current_chat_id = 0
+                if st.button("🗑️", key=f"del_{chat.id}", use_container_width=True):
+                    store.delete_conversation(chat.id)
+                    if st.session_state.conversation_id == chat.id:
+                        reset_chat()
                     st.rerun()
     else:
         st.markdown("<div style='color:#9ca3af;font-size:12px;'>No chats yet</div>", unsafe_allow_html=True)
+
+
+def render_search_results(query: str):
+    """Best hit per conversation, ranked; opening one shows the hit in context"""
+    store = get_store()
+    hits = store.search(st.session_state.owner_id, query, limit=40)
+    seen = set()
+    for hit in hits:
+        if hit.conversation_id in seen:
+            continue
+        seen.add(hit.conversation_id)
+        label = f"📄 {hit.title} · {hit.snippet}"
+        if st.button(label, key=f"hit_{hit.conversation_id}", use_container_width=True):
+            # Latest page, extended back far enough to include the hit
+            page = store.load_messages(hit.conversation_id, limit=max(30, hit.message_count - hit.seq + 5))
+            st.session_state.messages = page.messages
+            st.session_state.first_seq = page.first_seq
+            st.session_state.pop("context_summary", None)
+            st.session_state.pop("history_window", None)
+            st.session_state.conversation_id = hit.conversation_id
+            st.rerun()
+        if len(seen) == 8:
+            break
+    if not seen:
+        st.markdown("<div style='color:#9ca3af;font-size:12px;'>No matching chats</div>", unsafe_allow_html=True)
+
+
+def reset_chat():
+    """Start an empty, not-yet-persisted conversation"""
+    st.session_state.messages = []
+    st.session_state.first_seq = 0
+    st.session_state.pop("context_summary", None)
+    st.session_state.pop("history_window", None)
+    st.session_state.conversation_id = None
@@ -0,0 +1,179 @@
+import queue
+import threading
+import time
+import streamlit as st
+from typing import TYPE_CHECKING, Iterator, List, Optional
+from ai.cancel import CancelToken, Cancelled
+from ai.metrics import metrics
+from components.bubbles import bubble_html
+
+if TYPE_CHECKING:
+    from ai.ollama_client import GenerationResult
+
+TYPING_FRAMES = ("⏳ Thinking", "⏳ Thinking.", "⏳ Thinking..", "⏳ Thinking...")
+
+
+class StreamRenderer:
+    """Render a token stream into the current container in throttled frames.
+
+    Deltas are buffered and pushed to the browser at most ``max_fps`` times
+    per second (or as soon as ``frame_chars`` are pending). Once the live
+    tail grows past ``segment_chars`` it is sealed at a paragraph break (or
+    the last line break or space) and a fresh placeholder takes over, so
+    each frame re-sends only the tail instead of the whole reply.
+
+    The stream is read on a pump thread so the script thread never blocks
+    on the socket: while no delta arrives it redraws a typing indicator
+    every ``heartbeat`` seconds, which is also where Streamlit interrupts
+    a superseded run. Any interruption fires the cancel token, closing the
+    HTTP stream so Ollama stops decoding.
+    """
+
+    def __init__(
+        self,
+        max_fps: float = 12.0,
+        frame_chars: int = 400,
+        segment_chars: int = 1500,
+        heartbeat: float = 0.25,
+    ):
+        self.min_interval = 1.0 / max_fps
+        self.heartbeat = heartbeat
+        self.frame_chars = frame_chars
+        self.segment_chars = segment_chars
+        self.frames = 0
+        self.ttft: Optional[float] = None
+        self.render_seconds = 0.0
+        self._started = time.perf_counter()
+        self._sealed: List[str] = []
+        self._tail: List[str] = []
+        self._tail_len = 0
+        self._pending = 0
+        self._last_flush = 0.0
+        self._ticks = 0
+        self._events: "queue.Queue" = queue.Queue()
+        # Sealed segments go in their own container so later ones still
+        # render above whatever the caller adds below (status, Stop button)
+        self._segments = st.container()
+        self._placeholder = self._segments.empty()
+        self._status = st.empty()
+
+    @property
+    def text(self) -> str:
+        return "".join(self._sealed) + "".join(self._tail)
+
+    def feed(self, stream: Iterator[str], cancel: Optional[CancelToken] = None) -> "GenerationResult":
+        """Consume ``stream`` to the end and return its final result"""
+        from ai.ollama_client import GenerationResult   # imported with the first turn, not the first paint
+        cancel = cancel or CancelToken()
+        self._started = time.perf_counter()
+        threading.Thread(target=self._pump, args=(stream,), name="stream-pump", daemon=True).start()
+        result: Optional[GenerationResult] = None
+        try:
+            while result is None:
+                try:
+                    kind, value = self._events.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    self._tick()
+                    continue
+                if kind == "delta":
+                    self.push(value)
+                elif kind == "wait":
+                    self._show_queue(*value)
+                elif kind == "done":
+                    result = value or GenerationResult(self.text, "", None)
+                elif isinstance(value, Cancelled):
+                    result = GenerationResult(self.text, "", "cancelled")
+                else:
+                    raise value
+        finally:
+            if result is None:
+                cancel.cancel("interrupted")
+            self._status.empty()
+        self.finish()
+        if self.ttft is not None:
+            metrics.observe("ttft_seconds", self.ttft)
+        metrics.observe("render_seconds", self.render_seconds)
+        return result
+
+    def on_wait(self, position: int, eta: float):
+        """Scheduler callback; safe to call from the pump thread"""
+        self._events.put(("wait", (position, eta)))
+
+    def _pump(self, stream: Iterator[str]):
+        try:
+            while True:
+                self._events.put(("delta", next(stream)))
+        except StopIteration as stop:
+            self._events.put(("done", stop.value))
+        except BaseException as e:
+            self._events.put(("error", e))
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+
+    def _tick(self):
+        """Heartbeat while the stream is quiet"""
+        self._ticks += 1
+        if not self._sealed and not self._tail:
+            frame = TYPING_FRAMES[self._ticks % len(TYPING_FRAMES)]
+            self._placeholder.markdown(bubble_html("assistant", frame, continued=True), unsafe_allow_html=True)
+        elif self._pending:
+            self._flush(time.monotonic())
+        else:
+            self._status.empty()
+
+    def _show_queue(self, position: int, eta: float):
+        if position:
+            self._status.info(f"⏳ You're **#{position}** in line · about {eta:.0f}s")
+        else:
+            self._status.empty()
+
+    def push(self, delta: str):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self._started
+        self._tail.append(delta)
+        self._tail_len += len(delta)
+        self._pending += len(delta)
+        now = time.monotonic()
+        if self._pending >= self.frame_chars or now - self._last_flush >= self.min_interval:
+            self._flush(now)
+
+    def finish(self):
+        """Draw the last frame, timestamp included"""
+        started = time.perf_counter()
+        self._placeholder.markdown(bubble_html("assistant", "".join(self._tail)), unsafe_allow_html=True)
+        self.frames += 1
+        self.render_seconds += time.perf_counter() - started
+
+    def _flush(self, now: float):
+        started = time.perf_counter()
+        self._draw()
+        self._pending = 0
+        self._last_flush = now
+        self.render_seconds += time.perf_counter() - started
+
+    def _draw(self):
+        if self._tail_len >= self.segment_chars:
+            self._seal()
+        self._placeholder.markdown(
+            bubble_html("assistant", "".join(self._tail), continued=True), unsafe_allow_html=True
+        )
+        self.frames += 1
+
+    def _seal(self):
+        tail = "".join(self._tail)
+        # Cut after the last paragraph break, else line break, else space,
+        # leaving a non-empty tail; a tail that is never cut is re-sent whole
+        for sep in ("\n\n", "\n", " "):
+            cut = tail.rfind(sep, 0, len(tail) - 1)
+            if cut > 0:
+                break
+        else:
+            return
+        head, rest = tail[:cut + len(sep)], tail[cut + len(sep):]
+        self._placeholder.markdown(bubble_html("assistant", head, continued=True), unsafe_allow_html=True)
+        self._sealed.append(head)
+        self._placeholder = self._segments.empty()
+        self._tail = [rest] if rest else []
+        self._tail_len = len(rest)
@@ -0,0 +1,348 @@
+import atexit
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from storage.messages import Message
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id            INTEGER PRIMARY KEY,
+    owner         TEXT    NOT NULL,
+    title         TEXT    NOT NULL,
+    preview       TEXT    NOT NULL DEFAULT '',
+    created_at    REAL    NOT NULL,
+    updated_at    REAL    NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_conversations_owner ON conversations (owner, updated_at DESC);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id              INTEGER PRIMARY KEY,
+    conversation_id INTEGER NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    seq             INTEGER NOT NULL,
+    role            TEXT    NOT NULL,
+    content         TEXT    NOT NULL,
+    created_at      REAL    NOT NULL,
+    UNIQUE (conversation_id, seq)
+);
+"""
+
+# Full-text index over message content, kept in sync by triggers so it is
+# updated incrementally as batches are committed. The owner is an indexed
+# column too, so a search is narrowed to one owner inside the MATCH rather
+# than after ranking every owner's hits.
+SEARCH_SCHEMA = """
+CREATE VIEW IF NOT EXISTS messages_search AS
+    SELECT m.id, m.content, c.owner FROM messages m JOIN conversations c ON c.id = m.conversation_id;
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    content, owner, content='messages_search', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content, owner)
+    VALUES (new.id, new.content, (SELECT owner FROM conversations WHERE id = new.conversation_id));
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content, owner)
+    VALUES ('delete', old.id, old.content, (SELECT owner FROM conversations WHERE id = old.conversation_id));
+END;
+"""
+
+# Index layout before the owner column was added; dropped and rebuilt on open
+OLD_SEARCH_OBJECTS = ("messages_fts_insert", "messages_fts_delete", "messages_fts")
+
+SEARCH_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+log = logging.getLogger(__name__)
+
+
+class ConversationHeader(NamedTuple):
+    id: int
+    title: str
+    preview: str
+    updated_at: float
+    message_count: int
+
+
+class SearchHit(NamedTuple):
+    conversation_id: int
+    title: str
+    seq: int
+    role: str
+    snippet: str
+    score: float            # bm25, lower is better
+    message_count: int
+
+
+class MessagePage(NamedTuple):
+    messages: List[Message]
+    first_seq: int          # seq of messages[0]; 0 means nothing earlier to load
+
+
+def make_preview(text: str, width: int = 40) -> str:
+    """First line of ``text``, truncated for the sidebar"""
+    line = text.strip().split("\n")[0]
+    return line[:width] + ("..." if len(line) > width else "")
+
+
+class ConversationStore:
+    """Persistent chat history in SQLite (WAL mode).
+
+    Connections come from a small per-process pool so Streamlit script
+    threads never share one concurrently. Message writes are append-only and
+    go through a background writer that commits them in batches; a read
+    calls ``flush()`` first only while writes it could see are still
+    queued, so a session always sees its own writes without every read
+    waiting on the writer.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4, batch_size: int = 64, flush_interval: float = 0.2,
+                 write_retries: int = 3):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_retries = write_retries
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            index = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            ).fetchone()
+            if index and "owner" not in index[0]:
+                conn.executescript("".join(
+                    f"DROP {'TABLE' if name == 'messages_fts' else 'TRIGGER'} IF EXISTS {name};"
+                    for name in OLD_SEARCH_OBJECTS
+                ))
+                index = None
+            conn.executescript(SEARCH_SCHEMA)
+            if not index:
+                conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+        self._pending: "queue.Queue" = queue.Queue()
+        # Queued but not yet committed, per conversation, and their owners when known
+        self._unwritten: Counter = Counter()
+        self._owners: Dict[int, str] = {}
+        self._unwritten_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    # ---------- WRITES ----------
+    def create_conversation(self, owner: str, first_message: str) -> int:
+        """Create a conversation and return its id (written synchronously)"""
+        now = time.time()
+        with self._connection() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM conversations WHERE owner = ?", (owner,)).fetchone()[0]
+            cursor = conn.execute(
+                "INSERT INTO conversations (owner, title, preview, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (owner, f"Chat {count + 1}", make_preview(first_message), now, now),
+            )
+            return cursor.lastrowid
+
+    def append(
+        self, conversation_id: int, role: str, content: str, created_at: Optional[float] = None,
+        owner: Optional[str] = None,
+    ):
+        """Queue a message (``created_at`` in epoch seconds) for the next batch
+        commit; ``owner`` lets that owner's reads skip the flush once it lands"""
+        with self._unwritten_lock:
+            self._unwritten[conversation_id] += 1
+            if owner is not None:
+                self._owners[conversation_id] = owner
+        self._pending.put((conversation_id, role, content, time.time() if created_at is None else created_at))
+
+    def delete_conversation(self, conversation_id: int):
+        self.flush()
+        with self._connection() as conn:
+            # Messages first: the search index needs the owner to unindex them
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _flush_for(self, owner: Optional[str] = None, conversation_id: Optional[int] = None):
+        """``flush()`` if a queued write belongs to ``conversation_id`` or
+        (possibly, when its owner is unknown) to ``owner``"""
+        with self._unwritten_lock:
+            if conversation_id is not None:
+                pending = conversation_id in self._unwritten
+            else:
+                pending = any(self._owners.get(c, owner) == owner for c in self._unwritten)
+        if pending:
+            self.flush()
+
+    def flush(self, timeout: float = 5.0):
+        """Block until every queued message is committed"""
+        done = threading.Event()
+        self._pending.put(done)
+        done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                try:
+                    batch.append(self._pending.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            rows = [item for item in batch if not isinstance(item, threading.Event)]
+            if rows:
+                try:
+                    self._commit(rows)
+                except Exception:
+                    log.exception("Lost a batch of %d queued messages", len(rows))
+                self._written(rows)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _written(self, rows: List[tuple]):
+        """Rows are off the queue, committed or dropped"""
+        with self._unwritten_lock:
+            for conversation_id, _, _, _ in rows:
+                self._unwritten[conversation_id] -= 1
+                if self._unwritten[conversation_id] <= 0:
+                    del self._unwritten[conversation_id]
+                    self._owners.pop(conversation_id, None)
+
+    def _commit(self, rows: List[tuple]):
+        """Commit a batch, retrying when the database is busy; a row that
+        can't be written (its conversation was deleted) is logged and
+        dropped without taking the rest of the batch with it"""
+        for attempt in range(self.write_retries + 1):
+            try:
+                dropped = self._commit_once(rows)
+                break
+            except sqlite3.OperationalError as e:
+                if attempt == self.write_retries:
+                    log.error("Dropping %d queued messages after %d attempts: %s", len(rows), attempt + 1, e)
+                    return
+                time.sleep(0.05 * 2 ** attempt)
+        for (conversation_id, role, _, _), error in dropped:
+            log.warning("Dropped a %s message for conversation %s: %s", role, conversation_id, error)
+
+    def _commit_once(self, rows: List[tuple]) -> List[tuple]:
+        dropped = []
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    conversation_id, role, content, ts = row
+                    # One savepoint per row: a failed row is undone on its own
+                    conn.execute("SAVEPOINT message")
+                    try:
+                        conn.execute(
+                            "INSERT INTO messages (conversation_id, seq, role, content, created_at) "
+                            "SELECT ?, COALESCE(MAX(seq), -1) + 1, ?, ?, ? FROM messages WHERE conversation_id = ?",
+                            (conversation_id, role, content, ts, conversation_id),
+                        )
+                        conn.execute(
+                            "UPDATE conversations SET updated_at = ?, message_count = message_count + 1 WHERE id = ?",
+                            (ts, conversation_id),
+                        )
+                    except sqlite3.IntegrityError as e:
+                        conn.execute("ROLLBACK TO message")
+                        dropped.append((row, e))
+                    conn.execute("RELEASE message")
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        return dropped
+
+    # ---------- READS ----------
+    def list_conversations(self, owner: str, limit: int = 8, offset: int = 0) -> List[ConversationHeader]:
+        """Newest conversations first; headers only, no message bodies"""
+        self._flush_for(owner=owner)
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT id, title, preview, updated_at, message_count FROM conversations "
+                "WHERE owner = ? ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (owner, limit, offset),
+            ).fetchall()
+        return [ConversationHeader(*row) for row in rows]
+
+    def owner_of(self, conversation_id: int) -> Optional[str]:
+        """Owner of a conversation, or None if it doesn't exist"""
+        with self._connection() as conn:
+            row = conn.execute("SELECT owner FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row[0] if row else None
+
+    def load_messages(self, conversation_id: int, before_seq: Optional[int] = None, limit: int = 30) -> MessagePage:
+        """The ``limit`` messages preceding ``before_seq`` (default: the latest page)"""
+        self._flush_for(conversation_id=conversation_id)
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT seq, role, content, created_at FROM messages "
+                "WHERE conversation_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (conversation_id, before_seq if before_seq is not None else 2 ** 62, limit),
+            ).fetchall()
+        rows.reverse()
+        messages = [Message(role, content, ts) for _, role, content, ts in rows]
+        return MessagePage(messages, rows[0][0] if rows else 0)
+
+    def search(self, owner: str, query: str, limit: int = 20) -> List[SearchHit]:
+        """Ranked message hits for ``query`` across all of ``owner``'s chats"""
+        match = fts_query(query)
+        if not match:
+            return []
+        self._flush_for(owner=owner)
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT m.conversation_id, c.title, m.seq, m.role, "
+                "       snippet(messages_fts, 0, '**', '**', '…', 10), bm25(messages_fts, 1.0, 0.0), c.message_count "
+                "FROM messages_fts "
+                "JOIN messages m ON m.id = messages_fts.rowid "
+                "JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE messages_fts MATCH ? AND c.owner = ? "
+                "ORDER BY bm25(messages_fts, 1.0, 0.0) LIMIT ?",
+                (f"{{owner}} : {fts_phrase(owner)} AND {{content}} : ({match})", owner, limit),
+            ).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into a safe FTS5 query; the last word is a prefix match"""
+    tokens = SEARCH_TOKEN_RE.findall(text)
+    if not tokens:
+        return ""
+    terms = [f'"{t}"' for t in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    return " ".join(terms)
+
+
+def fts_phrase(text: str) -> str:
+    """``text`` as one quoted FTS5 phrase (the exact owner check follows in SQL)"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+# Global store instance
+store = ConversationStore(os.environ.get("SMARTBANK_DB", "smartbank.db"))
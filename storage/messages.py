@@ -0,0 +1,26 @@
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+
+class Message:
+    """One chat message, kept compact for long chats: slotted, with an
+    interned role and an epoch timestamp. ``tokens`` and ``html`` are
+    filled lazily by the context builder and the renderer."""
+
+    __slots__ = ("role", "content", "ts", "tokens", "html")
+
+    def __init__(self, role: str, content: str, ts: Optional[float] = None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.ts = time.time() if ts is None else ts
+        self.tokens: Optional[int] = None
+        self.html: Optional[str] = None
+
+    @property
+    def time(self) -> datetime:
+        return datetime.fromtimestamp(self.ts)
+
+    def for_model(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# The app's module-level singletons open their files on import; keep them out of the checkout
+_scratch = tempfile.mkdtemp(prefix="smartbank-tests-")
+os.environ.setdefault("SMARTBANK_DB", os.path.join(_scratch, "smartbank.db"))
+os.environ.setdefault("SMARTBANK_KB_INDEX", os.path.join(_scratch, "kb_index"))
@@ -0,0 +1,173 @@
+"""``/v1/chat`` driven at the ASGI level against ``benchmarks.mock_ollama``"""
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from ai.cache import ResponseCache
+from ai.context import ContextManager
+from ai.engine import STOPPED_NOTE, ChatEngine
+from ai.guard import is_banking_question
+from ai.ollama_client import OllamaClient
+from ai.pool import BackendPool
+from ai.retrieval import KnowledgeBase
+from api import ChatAPI
+from benchmarks.mock_ollama import MockConfig, serve
+from storage.conversations import ConversationStore
+
+PROMPT = "How long do NEFT transfers take to settle?"
+
+
+@pytest.fixture
+def mock_ollama():
+    server = serve(MockConfig(ttft=0.05, tokens_per_sec=50, jitter=0.0, max_tokens=60))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def build_api(server, tmp_path, **options) -> ChatAPI:
+    pool = BackendPool([OllamaClient(server.url)])
+    chat_engine = ChatEngine(
+        pool=pool,
+        context=ContextManager(pool),
+        kb=KnowledgeBase("knowledge", str(tmp_path / "kb_index")),
+        cache=ResponseCache(ttl=0),
+        conversations=ConversationStore(str(tmp_path / "chat.db")),
+        **options,
+    )
+    return ChatAPI(chat_engine)
+
+
+@pytest.fixture
+def chat_api(mock_ollama, tmp_path):
+    return build_api(mock_ollama, tmp_path, speculative=False)
+
+
+def wait_for_abort(server, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not server.stats["aborted"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+async def post_chat(
+    app: ChatAPI, body: Dict, disconnect_after: Optional[int] = None, headers: Tuple = ()
+) -> List[Tuple[str, Dict]]:
+    """POST ``body`` to /v1/chat; the client disconnects after ``disconnect_after`` deltas"""
+    events: List[Tuple[str, Dict]] = []
+    gone = asyncio.Event()
+    request = [{"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}]
+
+    async def receive():
+        if request:
+            return request.pop()
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200
+        for block in message.get("body", b"").decode().split("\n\n"):
+            if block:
+                name, data = (line.split(": ", 1)[1] for line in block.splitlines())
+                events.append((name, json.loads(data)))
+        deltas = sum(name == "delta" for name, _ in events)
+        if disconnect_after is not None and deltas >= disconnect_after:
+            gone.set()
+
+    scope = {"type": "http", "method": "POST", "path": "/v1/chat", "query_string": b"", "headers": list(headers)}
+    await asyncio.wait_for(app(scope, receive, send), 10)
+    return events
+
+
+async def get_json(app: ChatAPI, path: str, query: str = "", headers: Tuple = ()) -> Tuple[int, Dict]:
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode(), "headers": list(headers)}
+    await app(scope, receive, send)
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+
+def test_chat_streams_sse_and_persists_the_reply(chat_api):
+    events = asyncio.run(post_chat(chat_api, {"owner_id": "alice", "message": PROMPT}))
+
+    names = [name for name, _ in events]
+    assert names[0] == "meta" and names[-1] == "done"
+    assert names.count("delta") > 1
+    reply = "".join(data["text"] for name, data in events if name == "delta")
+    done = events[-1][1]
+    assert done["content"] == reply and done["done_reason"] == "stop"
+
+    store = chat_api.engine.store
+    store.flush()
+    page = store.load_messages(events[0][1]["conversation_id"])
+    assert [(m.role, m.content) for m in page.messages] == [("user", PROMPT), ("assistant", reply)]
+
+
+def test_disconnect_cancels_the_turn_and_the_upstream_stream(chat_api, mock_ollama):
+    events = asyncio.run(post_chat(chat_api, {"owner_id": "bob", "message": PROMPT}, disconnect_after=3))
+
+    assert "done" not in [name for name, _ in events]
+    wait_for_abort(mock_ollama)
+    assert mock_ollama.stats["aborted"] == 1
+    assert mock_ollama.stats["completed"] == 0
+
+    store = chat_api.engine.store
+    store.flush()
+    page = store.load_messages(events[0][1]["conversation_id"])
+    assert page.messages[-1].role == "assistant"
+    assert page.messages[-1].content.endswith(STOPPED_NOTE)
+
+
+def test_disconnect_while_checks_run_abandons_the_speculation(mock_ollama, tmp_path):
+    def slow_guard(prompt: str) -> bool:
+        time.sleep(0.3)
+        return is_banking_question(prompt)
+
+    chat_api = build_api(mock_ollama, tmp_path, speculative=True, guard=slow_guard)
+    events = asyncio.run(post_chat(chat_api, {"owner_id": "carol", "message": PROMPT}, disconnect_after=0))
+
+    assert events == []
+    wait_for_abort(mock_ollama)
+    assert mock_ollama.stats["aborted"] == 1
+    assert mock_ollama.stats["completed"] == 0
+
+
+def test_failing_check_abandons_the_speculation(mock_ollama, tmp_path):
+    def broken_guard(prompt: str) -> bool:
+        time.sleep(0.1)
+        raise RuntimeError("guard unavailable")
+
+    chat_api = build_api(mock_ollama, tmp_path, speculative=True, guard=broken_guard)
+    events = asyncio.run(post_chat(chat_api, {"owner_id": "dave", "message": PROMPT}))
+
+    assert [name for name, _ in events] == ["error"]
+    wait_for_abort(mock_ollama)
+    assert mock_ollama.stats["aborted"] == 1
+    assert mock_ollama.stats["completed"] == 0
+
+
+def test_api_keys_decide_the_owner(mock_ollama, tmp_path):
+    chat_api = build_api(mock_ollama, tmp_path, speculative=False)
+    chat_api.api_keys = {"alice-key": "alice", "bob-key": "bob"}
+    alice = ((b"authorization", b"Bearer alice-key"),)
+    bob = ((b"authorization", b"Bearer bob-key"),)
+
+    events = asyncio.run(post_chat(chat_api, {"message": PROMPT}, headers=alice))
+    conversation_id = events[0][1]["conversation_id"]
+    assert events[-1][0] == "done"
+
+    assert asyncio.run(get_json(chat_api, "/v1/conversations"))[0] == 401
+    assert asyncio.run(get_json(chat_api, "/v1/conversations", "owner_id=alice", bob))[0] == 403
+    status, listed = asyncio.run(get_json(chat_api, "/v1/conversations", headers=alice))
+    assert status == 200 and [c["id"] for c in listed["conversations"]] == [conversation_id]
+    assert asyncio.run(get_json(chat_api, "/v1/conversations", headers=bob))[1]["conversations"] == []
+    assert asyncio.run(get_json(chat_api, f"/v1/conversations/{conversation_id}/messages", headers=bob))[0] == 404
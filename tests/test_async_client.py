@@ -0,0 +1,63 @@
+"""``AsyncOllamaClient`` connection reuse against a scripted HTTP server"""
+import asyncio
+import json
+
+from ai.async_client import AsyncOllamaClient
+
+TAGS = json.dumps({"models": [{"name": "llama3.2:latest"}]}).encode()
+
+
+async def tags_server(close_after: int, announce_close: bool):
+    """Answers /api/tags; each connection serves ``close_after`` requests, then
+    closes either with ``Connection: close`` or by dropping the next request"""
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        served = 0
+        while await reader.readuntil(b"\r\n\r\n"):
+            if served == close_after:
+                break           # a keep-alive socket the server has given up on
+            served += 1
+            last = announce_close and served == close_after
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(TAGS)}\r\n".encode()
+                + (b"Connection: close\r\n" if last else b"")
+                + b"\r\n" + TAGS
+            )
+            await writer.drain()
+            if last:
+                break
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, connections
+
+
+async def models_twice(close_after: int, announce_close: bool):
+    server, connections = await tags_server(close_after, announce_close)
+    port = server.sockets[0].getsockname()[1]
+    client = AsyncOllamaClient(f"http://127.0.0.1:{port}", max_retries=0)
+    try:
+        first = await client.get_models()
+        pooled = len(client._idle)
+        second = await client.get_models()
+    finally:
+        await client.aclose()
+        server.close()
+    return first, second, pooled, len(connections)
+
+
+def test_connection_close_is_not_pooled():
+    first, second, pooled, connections = asyncio.run(models_twice(1, announce_close=True))
+    assert first == second == ["llama3.2:latest"]
+    assert pooled == 0
+    assert connections == 2
+
+
+def test_dead_pooled_connection_is_retried_on_a_fresh_one():
+    first, second, pooled, connections = asyncio.run(models_twice(1, announce_close=False))
+    assert first == second == ["llama3.2:latest"]
+    assert pooled == 1
+    assert connections == 2
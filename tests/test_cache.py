@@ -0,0 +1,18 @@
+"""``ResponseCache`` tiers and their context partitioning"""
+from ai.cache import ResponseCache
+
+
+def test_answers_are_only_reused_within_their_context():
+    cache = ResponseCache(max_entries=8)
+    cache.store("What are NEFT timings?", "llama3.2", "ctx-a", "24x7")
+
+    assert cache.lookup("What are NEFT timings?", "llama3.2", "ctx-a").tier == "exact"
+    assert cache.lookup("what are the NEFT timings", "llama3.2", "ctx-a").tier == "semantic"
+    assert cache.lookup("What are NEFT timings?", "llama3.2", "ctx-b") is None
+    assert cache.lookup("what are the NEFT timings", "llama3.2", "ctx-b") is None
+
+
+def test_group_is_a_fixed_width_hash():
+    assert ResponseCache._group("llama3.2", "ctx-a") == ResponseCache._group("llama3.2", "ctx-a")
+    assert ResponseCache._group("llama3.2", "ctx-a") != ResponseCache._group("llama3.2", "ctx-b")
+    assert 0 <= ResponseCache._group("llama3.2", "ctx-a") < 2 ** 60
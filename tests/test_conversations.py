@@ -0,0 +1,43 @@
+"""``ConversationStore`` batched writes and read-your-writes"""
+import pytest
+
+from storage.conversations import ConversationStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ConversationStore(str(tmp_path / "chat.db"), flush_interval=5.0)   # only flush() commits during a test
+
+
+def count_flushes(store, monkeypatch) -> list:
+    calls = []
+    flush = store.flush
+    monkeypatch.setattr(store, "flush", lambda *args: calls.append(1) or flush(*args))
+    return calls
+
+
+def test_reads_see_the_callers_queued_writes(store):
+    conversation = store.create_conversation("alice", "hi")
+    store.append(conversation, "user", "hi", owner="alice")
+
+    assert [m.content for m in store.load_messages(conversation).messages] == ["hi"]
+    assert store.list_conversations("alice")[0].message_count == 1
+    store.append(conversation, "assistant", "hello there", owner="alice")
+    assert store.search("alice", "hello")[0].conversation_id == conversation
+
+
+def test_reads_without_pending_writes_do_not_wait_on_the_writer(store, monkeypatch):
+    mine = store.create_conversation("alice", "hi")
+    store.append(mine, "user", "hi", owner="alice")
+    store.flush()
+    theirs = store.create_conversation("bob", "hi")
+    store.append(theirs, "user", "hi", owner="bob")
+
+    flushes = count_flushes(store, monkeypatch)
+    store.list_conversations("alice")
+    store.load_messages(mine)
+    store.search("alice", "hi")
+    assert flushes == []
+
+    store.list_conversations("bob")
+    assert flushes == [1]
@@ -0,0 +1,40 @@
+"""The default banking guard on everyday questions and off-topic uses of banking words"""
+import pytest
+
+from ai.guard import is_banking_question
+
+BANKING = [
+    "How do I transfer money to my friend?",
+    "My card is blocked",
+    "I forgot my PIN",
+    "What is my credit limit?",
+    "What is the interest rate?",
+    "Show my last statement",
+    "Download last month's statement",
+    "Report a security issue",
+    "transfer 5000 to Ramesh",
+    "what are your branch timings",
+    "Report my card as lost",
+]
+
+OFF_TOPIC = [
+    "Is there a speed limit on the Mumbai-Pune expressway?",
+    "Pin this message to the top of the group chat",
+    "Write a birthday card message for my sister",
+    "Transfer my photos from Android to iPhone",
+    "I'm not interested in cricket",
+    "How do I delete a git branch?",
+    "How much money should I spend on a holiday?",
+]
+
+
+@pytest.mark.parametrize("text", BANKING)
+@pytest.mark.parametrize("scored", [False, True])
+def test_everyday_banking_questions_are_allowed(text, scored):
+    assert is_banking_question(text, scored=scored)
+
+
+@pytest.mark.parametrize("text", OFF_TOPIC)
+@pytest.mark.parametrize("scored", [False, True])
+def test_off_topic_uses_of_banking_words_are_refused(text, scored):
+    assert not is_banking_question(text, scored=scored)
@@ -0,0 +1,51 @@
+"""``OllamaClient`` cancellation against ``benchmarks.mock_ollama``"""
+import threading
+import time
+
+import pytest
+
+from ai.cancel import CancelToken
+from ai.ollama_client import OllamaClient
+from benchmarks.mock_ollama import MockConfig, serve
+
+
+@pytest.fixture
+def slow_prefill():
+    server = serve(MockConfig(ttft=3.0, jitter=0.0, max_tokens=20))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def drain(stream):
+    while True:
+        try:
+            next(stream)
+        except StopIteration as stop:
+            return stop.value
+
+
+def test_cancel_during_prefill_drops_the_connection(slow_prefill):
+    client = OllamaClient(slow_prefill.url)
+    cancel = CancelToken()
+    threading.Timer(0.2, cancel.cancel).start()
+
+    started = time.monotonic()
+    result = drain(client.generate([{"role": "user", "content": "hi"}], "llama3.2", cancel=cancel))
+
+    assert result.done_reason == "cancelled"
+    assert time.monotonic() - started < 1.0
+    # The server finds the socket gone as soon as it has something to send
+    deadline = time.monotonic() + 5
+    while not slow_prefill.stats["aborted"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert slow_prefill.stats["aborted"] == 1
+    assert slow_prefill.stats["tokens"] == 0
+
+
+def test_connection_is_reused_after_a_normal_stream(slow_prefill):
+    slow_prefill.config.ttft = 0.0
+    client = OllamaClient(slow_prefill.url)
+    for _ in range(2):
+        result = drain(client.generate([{"role": "user", "content": "hi"}], "llama3.2"))
+        assert result.done_reason == "stop"
@@ -0,0 +1,52 @@
+"""``BackendPool`` routing across mock Ollama backends"""
+import pytest
+
+from ai.ollama_client import OllamaClient, OllamaError
+from ai.pool import BackendPool
+from benchmarks.mock_ollama import MockConfig, serve
+
+MESSAGES = [{"role": "user", "content": "What is NEFT?"}]
+
+
+@pytest.fixture
+def backends():
+    servers = [serve(MockConfig(ttft=0.0, jitter=0.0, max_tokens=5)) for _ in range(2)]
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_pool(servers) -> BackendPool:
+    pool = BackendPool([OllamaClient(s.url) for s in servers])
+    for backend in pool.backends:
+        assert backend.client.refresh_health().running
+    return pool
+
+
+def drain(stream):
+    while True:
+        try:
+            next(stream)
+        except StopIteration as stop:
+            return stop.value
+
+
+def test_model_missing_on_one_backend_tries_one_that_lists_it(backends):
+    pool = make_pool(backends)
+    backends[0].config.models = ["qwen2:latest"]    # removed since the last health probe
+
+    result = drain(pool.generate(MESSAGES, "llama3.2"))
+
+    assert result.done_reason == "stop"
+    assert backends[0].stats["requests"] == 1 and backends[1].stats["completed"] == 1
+    assert [b.failures for b in pool.backends] == [0, 0]
+    assert not any(b.ejected_until for b in pool.backends)
+
+
+def test_model_missing_everywhere_raises_without_ejecting(backends):
+    pool = make_pool(backends)
+
+    with pytest.raises(OllamaError, match="not found"):
+        drain(pool.generate(MESSAGES, "qwen2"))
+    assert [b.failures for b in pool.backends] == [0, 0]
@@ -0,0 +1,31 @@
+"""Deterministic intent routing in front of the LLM"""
+import pytest
+
+from ai.router import router
+
+ROUTED = [
+    ("hello", "greeting"),
+    ("what can you do", "help"),
+    ("What is my IFSC code?", "ifsc"),
+    ("branch address", "ifsc"),
+    ("Check my account balance", "balance"),
+]
+
+FALL_THROUGH = [
+    "IFSC code of Pune branch",
+    "ifsc code for mumbai branch",
+    "What is the MICR code of the Chennai branch?",
+    "How do NEFT transfers settle?",
+]
+
+
+@pytest.mark.parametrize("text, intent", ROUTED)
+def test_routes_common_intents(text, intent):
+    found = router.match(text)
+    assert found.intent == intent and found.confidence >= router.threshold
+
+
+@pytest.mark.parametrize("text", FALL_THROUGH)
+def test_unanswerable_specifics_fall_through_to_the_llm(text):
+    found = router.match(text)
+    assert found is None or found.confidence < router.threshold